@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of the tif generation and of the whole training pipeline, on synthetic training texts.
+
+Three benchmarks are available:
+    layout      MultiPageTif._fill_pages and the boxfile writing, without rendering any page,
+                so that texts of hundreds of MB can be measured (with --streaming)
+    rendering   MultiPageTif.generate_tif (_fill_pages and _multipage_tif) and generate_boxfile
+    training    TesseractTrainer.training(), the tesseract tools being replaced by the stubs
+                of benchmarks/stubs, sleeping --stub-latency seconds
+
+Each benchmark runs in its own process, so that its peak memory usage is measured on its own.
+The results are written as JSON, and summed up on stderr, along with the speedup over the
+results of a previous run if --baseline is given.
+
+example:
+    $ python benchmarks/bench.py --corpus-sizes 16K 1M --jobs 1 4 --output after.json --baseline before.json
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import string
+import sys
+import tempfile
+import time
+import traceback
+
+from os.path import abspath, dirname, exists, join
+
+BENCHMARKS_DIR = dirname(abspath(__file__))
+sys.path.insert(0, dirname(BENCHMARKS_DIR))  # benchmark the working copy, rather than an installed version
+
+from tesseract_trainer import __version__, TesseractTrainer, MultiFontTrainer
+from tesseract_trainer.multipage_tif import MultiPageTif, iter_words
+from tesseract_trainer.report import RunReport, Stopwatch
+
+
+FONTS_DIR = join(BENCHMARKS_DIR, 'fonts')  # Fonts bundled with the benchmarks (see fonts/LICENSE)
+STUBS_DIR = join(BENCHMARKS_DIR, 'stubs')  # Stubs of the tesseract training tools
+
+# Name -> file of the bundled fonts
+FONTS = {
+    'sans': 'DejaVuSans.ttf',
+    'serif': 'DejaVuSerif.ttf',
+    'mono': 'DejaVuSansMono.ttf',
+}
+
+BENCHMARKS = ['layout', 'rendering', 'training']
+CORPUS_SIZES = ['16K', '256K']  # Default sizes of the synthetic training texts
+PAGE_SIZE = (3600, 3600)  # Size of the tif pages (in px)
+MARGIN = 50  # Position of the first letter of each page (in px)
+
+# Characters of the synthetic training texts, lower case letters being the most frequent ones
+CHARACTERS = string.ascii_lowercase * 8 + string.ascii_uppercase + string.digits + '.,;:!?\'"()-' + u'éèàçüößñ'
+VOCABULARY_SIZE = 20000  # Number of distinct words of the synthetic training texts
+WORDS_PER_LINE = 12
+
+
+def parse_size(size):
+    """ Return the number of bytes of a size such as 512, 16K, 1M or 1G """
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    try:
+        if size[-1].upper() in units:
+            return int(float(size[:-1]) * units[size[-1].upper()])
+        return int(size)
+    except (ValueError, IndexError):
+        raise SystemExit("Invalid corpus size %s. Aborting." % (size))
+
+
+def generate_corpus(path, size, seed=0):
+    """ Write a synthetic utf-8 training text of at least 'size' bytes to 'path'. The words are drawn
+        from a random vocabulary, the first words of which are much more frequent than the last ones.
+        The text only depends on 'size' and 'seed'.
+    """
+    rng = random.Random(seed)
+    vocabulary = [u''.join(rng.choice(CHARACTERS) for _ in range(rng.randint(1, 10))).encode('utf-8')
+        for _ in range(VOCABULARY_SIZE)]
+    written = 0
+    with open(path + '.tmp', 'wb') as corpus:
+        while written < size:
+            line = b' '.join(vocabulary[int(VOCABULARY_SIZE * rng.random() ** 3)]
+                for _ in range(WORDS_PER_LINE)) + b'\n'
+            corpus.write(line)
+            written += len(line)
+    os.rename(path + '.tmp', path)
+
+
+def corpus_path(workdir, size_label, seed):
+    """ Return the path of a synthetic training text, generating it if it does not exist yet """
+    path = join(workdir, 'corpus.%s.%d.txt' % (size_label, seed))
+    if not exists(path):
+        print('Generating the %s training text %s' % (size_label, path), file=sys.stderr)
+        generate_corpus(path, parse_size(size_label), seed)
+    return path
+
+
+def _training_text(path, streaming):
+    """ Return the MultiPageTif text of a training text: lazily read words, or the whole text """
+    return iter_words(path) if streaming else open(path, 'rb').read().replace(b'\n', b' ')
+
+
+def _multipage_tif(settings, corpus, font, report, directory):
+    return MultiPageTif(_training_text(corpus, settings['streaming']), PAGE_SIZE[0], PAGE_SIZE[1], MARGIN, MARGIN,
+        font, join(FONTS_DIR, FONTS[font]), settings['font_size'], 0, 'bench', False, jobs=settings['jobs'],
+        streaming=settings['streaming'], report=report, directory=directory, bilevel=settings['bilevel'])
+
+
+def bench_layout(settings, corpus, directory):
+    """ Lay out a training text and write its boxfile, without rendering the pages """
+    report = RunReport()
+    mp = _multipage_tif(settings, corpus, settings['fonts'][0], report, directory)
+    stopwatch = Stopwatch()
+    with stopwatch.running():
+        pages = mp._fill_pages()
+        for _ in (mp._stream_boxfile(pages) if settings['streaming'] else pages):
+            pass
+    report.phase('fill_pages', stopwatch, prefix=mp.prefix, pages=mp.page_count, glyphs=mp.glyph_count,
+        fill_ratio=mp.fill_ratio())
+    mp.generate_boxfile()
+    return report.as_dict()
+
+
+def bench_rendering(settings, corpus, directory):
+    """ Lay out and render a training text into a multipage tif, and write its boxfile """
+    report = RunReport()
+    mp = _multipage_tif(settings, corpus, settings['fonts'][0], report, directory)
+    mp.generate_tif()
+    mp.generate_boxfile()
+    return report.as_dict()
+
+
+def bench_training(settings, corpus, directory):
+    """ Run a whole training on a training text, with the stub tesseract tools """
+    os.environ['PATH'] = STUBS_DIR + os.pathsep + os.environ.get('PATH', '')
+    os.environ['TESSTRAIN_STUB_LATENCY'] = str(settings['stub_latency'])
+    os.chdir(directory)  # the traineddata file is written to the current directory
+    with open('font_properties', 'w') as font_properties:
+        for font in settings['fonts']:
+            font_properties.write('%s 0 0 0 0 0\n' % (font))
+    kwargs = dict(font_properties='font_properties', tessdata_path=directory, verbose=False, jobs=settings['jobs'],
+        streaming=settings['streaming'], bilevel=settings['bilevel'])
+    if len(settings['fonts']) > 1:
+        trainer = MultiFontTrainer('bench', corpus, [(font, join(FONTS_DIR, FONTS[font]), settings['font_size'])
+            for font in settings['fonts']], **kwargs)
+    else:
+        font = settings['fonts'][0]
+        trainer = TesseractTrainer('bench', corpus, font, join(FONTS_DIR, FONTS[font]), font_size=settings['font_size'],
+            **kwargs)
+    trainer.training()
+    trainer.clean()
+    return trainer.report.as_dict()
+
+
+def _rates(record, wall_time):
+    """ Add the glyphs/s and pages/s rates of a record holding 'glyphs' and 'pages' counters """
+    for counter in ('glyphs', 'pages'):
+        if counter in record and wall_time > 0:
+            record['%s_per_s' % (counter)] = record[counter] / wall_time
+    return record
+
+
+def _run_isolated(connection, benchmark, settings, corpus, directory):
+    """ Run a benchmark in a child process, and send its result (or error) through 'connection' """
+    try:
+        # the output of the training commands is not part of the results
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        start_time = time.time()
+        report = globals()['bench_%s' % (benchmark)](settings, corpus, directory)
+        wall_time = time.time() - start_time
+        children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        connection.send((None, {
+            'wall_time': wall_time,
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'children_max_rss_kb': children_usage.ru_maxrss,
+            'phases': [_rates(phase, phase['wall_time']) for phase in report['phases']],
+            'stages': report['stages'],
+        }))
+    except BaseException:
+        connection.send((traceback.format_exc(), None))
+
+
+def run_benchmark(benchmark, settings, corpus_label, corpus, workdir):
+    """ Run a benchmark in its own process and directory, and return its result """
+    directory = tempfile.mkdtemp(prefix='%s.' % (benchmark), dir=workdir)
+    receiver, sender = multiprocessing.Pipe(False)
+    process = multiprocessing.Process(target=_run_isolated, args=(sender, benchmark, settings, corpus, directory))
+    process.start()
+    # the child holds the only sending end left: if it dies without sending its result, recv raises EOFError
+    sender.close()
+    try:
+        error, measures = receiver.recv()
+    except EOFError:
+        error, measures = None, None
+    finally:
+        process.join()
+        shutil.rmtree(directory, ignore_errors=True)
+    if error is None and (measures is None or process.exitcode != 0):
+        error = 'Its process exited with code %s.' % (process.exitcode)
+    if error is not None:
+        raise SystemExit("The %s benchmark failed:\n%s Aborting." % (benchmark, error))
+
+    result = dict(settings, benchmark=benchmark, corpus=corpus_label, corpus_bytes=os.path.getsize(corpus), **measures)
+    if benchmark != 'training':
+        del result['stub_latency']
+    fill_pages = [phase for phase in measures['phases'] if phase['name'] == 'fill_pages']
+    result['glyphs'] = sum(phase['glyphs'] for phase in fill_pages)
+    result['pages'] = sum(phase['pages'] for phase in fill_pages)
+    return _rates(result, measures['wall_time'])
+
+
+def result_key(result):
+    """ Return what identifies a benchmark across runs """
+    return (result['benchmark'], result['corpus'], tuple(result['fonts']), result['font_size'], result['jobs'],
+        result['streaming'], result['bilevel'], result.get('stub_latency'))
+
+
+def summary_line(result, baseline=None):
+    """ Return a human readable line summing up a result, and its speedup over the 'baseline' result """
+    line = '%-9s %6s %-14s j=%-2d %9.2fs %11.0f glyphs/s %8.2f pages/s %8.1f MB' % (
+        result['benchmark'], result['corpus'], ','.join(result['fonts']), result['jobs'], result['wall_time'],
+        result.get('glyphs_per_s', 0), result.get('pages_per_s', 0),
+        max(result['max_rss_kb'], result['children_max_rss_kb']) / 1024.0)
+    if baseline is not None:
+        line += '  x%.2f' % (baseline['wall_time'] / result['wall_time'])
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the tif generation and the training pipeline.')
+    parser.add_argument('--benchmarks', nargs='+', choices=BENCHMARKS, default=['rendering', 'training'],
+        help="The benchmarks to run. Default: rendering training.")
+    parser.add_argument('--corpus-sizes', nargs='+', default=CORPUS_SIZES, metavar='SIZE',
+        help="The sizes of the synthetic training texts, such as 16K, 10M or 1G. Default: %s." % (' '.join(CORPUS_SIZES)))
+    parser.add_argument('--fonts', nargs='+', choices=sorted(FONTS), default=['sans'],
+        help="The bundled fonts to use. The training benchmark trains on all of them at once, "
+             "the other benchmarks only use the first one. Default: sans.")
+    parser.add_argument('--font-size', type=int, default=25, help="The font size, in px. Default: 25.")
+    parser.add_argument('--jobs', type=int, nargs='+', default=[1],
+        help="The numbers of processes to benchmark with (--jobs of tesstrain). Default: 1.")
+    parser.add_argument('--streaming', action='store_true', help="Use this argument to benchmark streaming mode.")
+    parser.add_argument('--bilevel', action='store_true', help="Use this argument to render the pages in black & white.")
+    parser.add_argument('--stub-latency', type=float, default=0.0,
+        help="The number of seconds each stub tesseract tool sleeps for. Default: 0.")
+    parser.add_argument('--seed', type=int, default=0, help="The seed of the synthetic training texts. Default: 0.")
+    parser.add_argument('--workdir', type=str,
+        help="The directory the training texts are generated in, and kept for the next runs. "
+             "By default, a temporary directory is used, and removed afterwards.")
+    parser.add_argument('--output', '-o', type=str, help="The path of the JSON results. Default: stdout.")
+    parser.add_argument('--baseline', type=str,
+        help="The path of the JSON results of a previous run, to compare the wall times with.")
+    args = parser.parse_args()
+
+    workdir = abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix='tesstrain-bench.')
+    if not exists(workdir):
+        os.makedirs(workdir)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, 'r') as baseline_file:
+            baseline = dict((result_key(result), result) for result in json.load(baseline_file)['results'])
+
+    results = []
+    try:
+        for corpus_label in args.corpus_sizes:
+            corpus = corpus_path(workdir, corpus_label, args.seed)
+            for benchmark in args.benchmarks:
+                for jobs in (args.jobs if benchmark != 'layout' else [1]):  # the layout runs in a single process
+                    settings = {'fonts': args.fonts, 'font_size': args.font_size, 'jobs': jobs,
+                        'streaming': args.streaming, 'bilevel': args.bilevel, 'stub_latency': args.stub_latency}
+                    result = run_benchmark(benchmark, settings, corpus_label, corpus, workdir)
+                    results.append(result)
+                    print(summary_line(result, baseline.get(result_key(result))), file=sys.stderr)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    document = {
+        'version': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': multiprocessing.cpu_count(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'seed': args.seed,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(document, output, indent=2, sort_keys=True)
+    else:
+        json.dump(document, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
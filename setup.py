@@ -18,9 +18,9 @@ setup(
     author_email='rouberol.b@gmail.com',
     url='https://github.com/BaltoRouberol/TesseractTrainer',
     packages=['tesseract_trainer'],
-    install_requires=['Pillow>=2.0.0'],
+    install_requires=['Pillow>=3.4.0'],
     keywords=['tesseract', 'OCR', 'optical character recogniton', 'training'],
-    scripts=['tesseract_trainer/tesstrain'],
+    scripts=['tesseract_trainer/tesstrain', 'tesseract_trainer/tessqueue'],
     classifiers=[
            'Development Status :: 3 - Alpha',
            'Environment :: Console',
@@ -7,13 +7,28 @@ https://code.google.com/p/tesseract-ocr/wiki/TrainingTesseract3
 __version__ = '0.1.1'
 __author__ = 'Balthazar Rouberol, rouberol.b@gmail.com'
 
+import copy
+import multiprocessing
 import shutil
 import os
 import subprocess
+import sys
+import threading
+import time
 
-from os.path import join, exists
+from multiprocessing.pool import ThreadPool
+from os.path import exists
 
-from multipage_tif import MultiPageTif
+import multipage_tif
+from layout import PageLayout, DensePageLayout
+from degradation import parse_degradation
+from multipage_tif import MultiPageTif, iter_words, split_multipage_tif
+from report import RunReport, Stopwatch
+from sampler import CoverageSampler
+from stages import Stage, StageManifest, run_stages, tool_fingerprint
+from traineddata import COMPONENTS, install_traineddata, pack_traineddata
+from unicharset import Unicharset
+from workspace import Workspace
 
 
 # list of files generated during the training procedure
@@ -25,6 +40,25 @@ EXP_NUMBER = 0  # Default experience number, used in generated files name
 TESSDATA_PATH = '/usr/local/share/tessdata'  # Default path to the 'tessdata' directory
 WORD_LIST = None  # Default path to the "word_list" file, contaning frequent words
 VERBOSE = True  # verbosity enabled by default. Set to False to remove all text outputs
+GLYPH_CACHE = None  # Default path to the file persisting the glyph metrics. If None, metrics are not persisted
+JOBS = 1  # Default number of processes rendering the tif pages
+STREAMING = False  # Streaming disabled by default. Set to True to train on texts too large to fit in memory
+SHARDS = 1  # Default number of multipage tif shards tesseract trains on in parallel
+REPORT = None  # Default path of the JSON training report. If None, no report is written
+PROFILE = None  # Default directory of the tif rendering cProfile statistics. If None, the rendering is not profiled
+SAMPLE = None  # Default number of samples of each character the training text is sampled for. If None, the whole text is used
+SAMPLE_BIGRAMS = False  # Bigram sampling disabled by default. Set to True to also sample each pair of consecutive characters
+MAX_GLYPHS = None  # Default maximum number of characters of the sampled training text. If None, there is no limit
+PAGE_SIZE = (3600, 3600)  # Default (width, height) of the tif pages, in px
+MARGIN = 50  # Default position of the first letter of each page, from the top left corner of the page (in px)
+LEADING = None  # Default space between two lines (in px). If None, the default of the layout is used: 40px, or 10px if dense
+TRACKING = 8.9  # Default space added after each character (in px)
+DENSE = False  # Dense layout disabled by default. Set to True to pack the lines using their actual height
+BILEVEL = False  # Greyscale rendering by default. Set to True to render the tif pages directly in black & white
+DEGRADATION = None  # Default degradation (rotation, blur, noise) of the tif pages. If None, the pages are not degraded
+WORKSPACE = None  # Default directory of the training intermediate files. If None, a new directory is created for each training
+TMPFS = False  # Set to True to create the training directory on tmpfs (/dev/shm), when no workspace is given
+COMPONENTS_DIR = None  # Default directory of the optional component files (config, unicharambigs...). If None, the current directory
 
 
 class TesseractTrainer:
@@ -40,11 +74,35 @@ class TesseractTrainer:
         exp_number=EXP_NUMBER,
         tessdata_path=TESSDATA_PATH,
         word_list=WORD_LIST,
-        verbose=VERBOSE):
-
-        # Training text: the text used for the multipage tif generation
-        # we replace all \n by " " as we'll split the text over " "s
-        self.training_text = open(text).read().replace("\n", " ")
+        verbose=VERBOSE,
+        glyph_cache=GLYPH_CACHE,
+        jobs=JOBS,
+        streaming=STREAMING,
+        shards=SHARDS,
+        report=REPORT,
+        profile=PROFILE,
+        sample=SAMPLE,
+        sample_bigrams=SAMPLE_BIGRAMS,
+        max_glyphs=MAX_GLYPHS,
+        page_size=PAGE_SIZE,
+        margin=MARGIN,
+        leading=LEADING,
+        tracking=TRACKING,
+        dense=DENSE,
+        bilevel=BILEVEL,
+        degradation=DEGRADATION,
+        workspace=WORKSPACE,
+        tmpfs=TMPFS,
+        components_dir=COMPONENTS_DIR):
+
+        # Set streaming to True to read the training text lazily, and write the boxfile as the pages
+        # are generated, so that memory usage does not depend on the size of the training text
+        self.streaming = streaming
+
+        # Local path to the training text: the text used for the multipage tif generation
+        self.text = text
+        if not exists(self.text):
+            raise SystemExit("The %s file does not exist. Aborting." % (self.text))
 
         # Experience number: naming convention defined in the Tesseract training wiki
         self.exp_number = exp_number
@@ -52,29 +110,27 @@ class TesseractTrainer:
         # The name of the result Tesseract "dictionary", trained on a new language/font
         self.dictionary_name = dictionary_name
 
+        # Local path to the 'font_propperties' file
+        self.font_properties = font_properties
+
         # The name of the font you're training tesseract on.
         # WARNING: this name must match a font name in the font_properties file
         # and must not contain spaces
         self.font_name = font_name
-        if ' ' in self.font_name:
-            raise SystemExit("The --font-name / -F argument must not contain any spaces. Aborting.")
 
         # The local path to the TrueType/OpentType file of the training font
         self.font_path = font_path
-        if not exists(self.font_path):
-            raise SystemExit("The %s file does not exist. Aborting." % (self.font_path))
 
         # The font size (in px) used during the multipage tif generation
         self.font_size = font_size
 
+        self._check_font()
+
         # The prefix of all generated tifs, boxfiles, training files (ex: eng.helveticanarrow.exp0.box)
         self.prefix = '%s.%s.exp%s' % (self.dictionary_name, self.font_name, str(self.exp_number))
 
-        # Local path to the 'font_propperties' file
-        self.font_properties = font_properties
-        with open(self.font_properties, 'r') as fp:
-            if self.font_name not in fp.read().split():
-                raise SystemExit("The font properties of %s have not been defined in %s. Aborting." % (self.font_name, self.font_properties))
+        # The prefixes of all the boxfiles and training files the dictionary is trained on
+        self.prefixes = [self.prefix]
 
         # Local path to the 'tessdata' directory
         self.tessdata_path = tessdata_path
@@ -87,121 +143,563 @@ class TesseractTrainer:
         # Set verbose to True to display the training commands output
         self.verbose = verbose
 
-    def _generate_boxfile(self):
+        # Local path to the file persisting the font glyph metrics across trainings
+        self.glyph_cache = glyph_cache
+
+        # Number of processes rendering the multipage tif pages in parallel
+        self.jobs = jobs
+
+        # Number of shards the multipage tif is split into, tesseract training on each shard in parallel
+        self.shards = shards
+
+        # Number of samples of each character the training text is sampled for, before generating the tif:
+        # only the words providing samples of characters lacking some are kept. If None, the whole text is used.
+        self.sample = sample
+
+        # Set sample_bigrams to True to also sample each pair of consecutive characters
+        self.sample_bigrams = sample_bigrams
+
+        # Maximum number of characters of the sampled training text. If None, there is no limit.
+        self.max_glyphs = max_glyphs
+
+        # (width, height) of the tif pages (in px)
+        self.page_size = tuple(page_size)
+
+        # Margin of the tif pages (in px). In the default layout, it only sets the position of the first letter.
+        self.margin = margin
+
+        # Space between two lines, and space added after each character (in px)
+        self.leading = leading
+        self.tracking = tracking
+
+        # Set dense to True to lay out the text with DensePageLayout: lines as high as their highest
+        # character box, and margins on all sides, so that fewer pages are rendered and trained on
+        self.dense = dense
+
+        # Set bilevel to True to render the tif pages directly in black & white, with glyphs thresholded once
+        # per character: pages take less memory and time to render, but overlapping glyphs may differ slightly
+        self.bilevel = bilevel
+
+        # Degradation (rotation, blur, noise) applied to the tif pages, as a Degradation or a
+        # "name=value,..." string (see parse_degradation). If None, the pages are not degraded.
+        self.degradation = parse_degradation(degradation) if isinstance(degradation, basestring) else degradation
+
+        # Character set of each boxfile generated during this training, by prefix
+        self.unicharsets = {}
+
+        # Directory the intermediate files of the training are written to, and the training tools are run in.
+        # Unless a 'workspace' path is given, a new directory is created, in /dev/shm if 'tmpfs' is True.
+        # Only the traineddata file is copied out of it, to the current directory.
+        # It is created once the other settings are checked, so that an invalid setting does not leave it behind.
+        self.workspace = Workspace(workspace, tmpfs, name=self.dictionary_name)
+
+        # Directory of the optional component files of the dictionary which are not generated by the training
+        # ({self.dictionary_name}.config, .unicharambigs...): the ones found there are copied to the workspace,
+        # and packed into the traineddata file. If None, the current directory (when the trainer is created).
+        self.components_dir = os.path.abspath(components_dir or '.')
+
+        # Local paths to the sampled training text, and to the JSON report of its character coverage
+        self.sample_text = self.workspace.join('%s.sample.txt' % (self.dictionary_name))
+        self.coverage_path = self.workspace.join('%s.coverage.json' % (self.dictionary_name))
+
+        # Record of the training stages run so far, allowing to resume the training
+        self.manifest = StageManifest(self.workspace.join('%s.stages.json' % (self.dictionary_name)))
+
+        # Local path of the JSON report of the training timings and resource usage
+        self.report_path = report
+
+        # Timings and resource usage of the training, optionally along with the cProfile statistics
+        # of the tif rendering, written in the 'profile' directory
+        self.report = RunReport(profile_dir=profile)
+
+    def _check_font(self):
+        """ Abort if the training font name or path is not valid """
+        check_font(self.font_name, self.font_path, self.font_properties)
+
+    def _training_text_path(self):
+        """ Return the path of the text the multipage tifs are filled with: the sampled training text
+            if the training text is sampled, and the training text otherwise.
+        """
+        return self.sample_text if self.sample is not None else self.text
+
+    def _sample_training_text(self):
+        """ Select the words of the training text giving each character self.sample samples,
+            and write them to self.sample_text, along with their coverage to self.coverage_path
+        """
+        sampler = CoverageSampler(self.sample, bigrams=self.sample_bigrams, max_glyphs=self.max_glyphs)
+        stopwatch = Stopwatch()
+        with stopwatch.running():
+            with open(self.sample_text, 'w') as sample_file:
+                for word in sampler.sample(iter_words(self.text)):
+                    sample_file.write(word + '\n')
+            sampler.write_coverage(self.coverage_path)
+        undercovered = sampler.undercovered()
+        self.report.phase('sample', stopwatch, words_read=sampler.words_read, words_selected=sampler.words_selected,
+            glyphs=sampler.glyph_count, undercovered=len(undercovered), truncated=sampler.truncated)
+        if self.verbose:
+            print('Sampled %d of %d words (%d characters).' % (sampler.words_selected,
+                sampler.words_read, sampler.glyph_count))
+            if sampler.truncated:
+                print('The selection stopped at %d characters (max_glyphs).' % (self.max_glyphs))
+            if undercovered:
+                bigram_count = len([unit for unit in undercovered if len(unit) == 2])
+                print('%d characters and %d bigrams of the training text have less than %d samples, see %s.' % (
+                    len(undercovered) - bigram_count, bigram_count, self.sample,
+                    os.path.abspath(os.path.basename(self.coverage_path))))
+
+    def _page_layout(self):
+        """ Return the layout engine placing the training text characters on the tif pages """
+        layout = DensePageLayout if self.dense else PageLayout
+        width, height = self.page_size
+        return layout(width, height, self.margin, self.margin, self.leading, self.tracking)
+
+    def _training_words(self):
+        """ Return the words of the training text the multipage tifs are filled with.
+            In streaming mode, the text is read as the multipage tif is generated.
+        """
+        text_path = self._training_text_path()
+        if self.streaming:
+            return iter_words(text_path)
+        # we replace all \n by " " as we'll split the text over " "s
+        return open(text_path).read().replace("\n", " ").split(' ')
+
+    def _generate_boxfile(self, training_words=None):
         """ Generate a multipage tif, filled with the training text and generate a boxfile
-            from the coordinates of the characters inside it
+            from the coordinates of the characters inside it.
+            'training_words' are the words of the training text, if already read.
         """
-        mp = MultiPageTif(self.training_text, 3600, 3600, 50,50, self.font_name, self.font_path,
-            self.font_size, self.exp_number, self.dictionary_name, self.verbose)
-        mp.generate_tif()  # generate a multi-page tif, filled with self.training_text
+        training_text = training_words if training_words is not None else self._training_words()
+        layout = self._page_layout()
+        mp = MultiPageTif(training_text, layout.width, layout.height, layout.margin_x, layout.margin_y, self.font_name,
+            self.font_path, self.font_size, self.exp_number, self.dictionary_name, self.verbose,
+            glyph_cache=self.glyph_cache, jobs=self.jobs, streaming=self.streaming, report=self.report, layout=layout,
+            directory=self.workspace.path, bilevel=self.bilevel, degradation=self.degradation)
+        mp.generate_tif()  # generate a multi-page tif, filled with the training text
         mp.generate_boxfile()  # generate the boxfile, associated with the generated tif
+        self.unicharsets[self.prefix] = mp.unicharset
 
     def _train_on_boxfile(self):
-        """ Run tesseract on training mode, using the generated boxfiles """
-        cmd = 'tesseract {prefix}.tif {prefix} nobatch box.train'.format(prefix=self.prefix)
-        print(cmd)
-        run = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        display_output(run, self.verbose)
+        """ Run tesseract on training mode, using the generated boxfiles.
+            If self.shards > 1, the multipage tif and boxfile are split in shards of consecutive pages,
+            tesseract trains on each shard in parallel, and the resulting training files are
+            concatenated in page order.
+        """
+        if self.shards <= 1:
+            self._box_train(self.prefix)
+            return
+
+        shard_prefixes = split_multipage_tif(self.workspace.join(self.prefix), self.shards)
+        pool = ThreadPool(len(shard_prefixes))
+        try:
+            pool.map(self.report.bind(self._box_train), shard_prefixes)
+        finally:
+            pool.close()
+            pool.join()
+
+        for ext in ('tr', 'txt'):
+            shard_files = ['%s.%s' % (shard_prefix, ext) for shard_prefix in shard_prefixes]
+            if not all(exists(shard_file) for shard_file in shard_files):
+                continue
+            with open(self.workspace.join('%s.%s' % (self.prefix, ext)), 'wb') as merged_file:
+                for shard_file in shard_files:
+                    with open(shard_file, 'rb') as f:
+                        shutil.copyfileobj(f, merged_file)
+        for shard_prefix in shard_prefixes:
+            for ext in ('tif', 'box', 'tr', 'txt'):
+                if exists('%s.%s' % (shard_prefix, ext)):
+                    os.remove('%s.%s' % (shard_prefix, ext))
+
+    def _box_train(self, prefix):
+        """ Run tesseract on training mode on the {prefix}.tif multipage tif and {prefix}.box boxfile of the workspace """
+        cmd = ['tesseract', '%s.tif' % (prefix), prefix, 'nobatch', 'box.train']
+        with _display_lock:  # the shards are trained on concurrently
+            print(' '.join(cmd))
+        run_command(cmd, self.verbose, self.report, cwd=self.workspace.path)
 
     def _compute_character_set(self):
         """ Computes the character properties set: isalpha, isdigit, isupper, islower, ispunctuation
-            and encode it in the 'unicharset' data file
-
-            examples:
-            ';' is an punctuation character. Its properties are thus represented
-                by the binary number 10000 (10 in hexadecimal).
-            'b' is an alphabetic character and a lower case character.
-                Its properties are thus represented by the binary number 00011 (3 in hexadecimal).
-            W' is an alphabetic character and an upper case character. Its properties are
-                thus represented by the binary number 00101 (5 in hexadecimal).
-            '7' is just a digit. Its properties are thus represented by the binary number 01000 (8 in hexadecimal).
-            '=' does is not punctuation not digit or alphabetic character. Its properties
-                 are thus represented by the binary number 00000 (0 in hexadecimal).
-        """
-        cmd = 'unicharset_extractor %s.box' % (self.prefix)
-        run = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        display_output(run, self.verbose)
+            and encode it in the 'unicharset' data file (see unicharset.char_properties)
+
+            The characters are the ones laid out while generating the boxfiles. If the boxfiles were
+            generated by a previous training, the characters are read from the boxfiles.
+        """
+        unicharset = Unicharset()
+        for prefix in self.prefixes:
+            if prefix in self.unicharsets:
+                unicharset.update(self.unicharsets[prefix])
+            else:
+                unicharset.update(Unicharset.from_boxfile(self.workspace.join('%s.box' % (prefix))))
+        if self.verbose:
+            print('Writing the unicharset file (%d characters)' % (len(unicharset)))
+        unicharset.write(self.workspace.join('unicharset'))
 
     def _clustering(self):
         """ Cluster character features from all the training pages, and create characters prototype """
-        cmd = 'mftraining -F font_properties -U unicharset %s.tr' % (self.prefix)
-        print(cmd)
-        run = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        display_output(run, self.verbose)
+        cmd = ['mftraining', '-F', os.path.abspath(self.font_properties), '-U', 'unicharset'] + [
+            '%s.tr' % (prefix) for prefix in self.prefixes]
+        with _display_lock:  # other stages run concurrently
+            print(' '.join(cmd))
+        run_command(cmd, self.verbose, self.report, cwd=self.workspace.path)
 
     def _normalize(self):
         """ Generate the 'normproto' data file (the character normalization sensitivity prototypes) """
-        cmd = 'cntraining %s.tr' % (self.prefix)
-        run = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        display_output(run, self.verbose)
+        cmd = ['cntraining'] + ['%s.tr' % (prefix) for prefix in self.prefixes]
+        run_command(cmd, self.verbose, self.report, cwd=self.workspace.path)
 
     def _rename_files(self):
-        """ Add the self.dictionary_name prefix to each file generated during the tesseract training process """
+        """ Add the self.dictionary_name prefix to each file generated during the tesseract training process.
+            The files are copied rather than moved, so that the training can be resumed from any stage.
+        """
         for generated_file in GENERATED_DURING_TRAINING:
             print(generated_file)
-            os.rename('%s' % (generated_file), '%s.%s' % (self.dictionary_name, generated_file))
+            shutil.copyfile(self.workspace.join(generated_file),
+                self.workspace.join('%s.%s' % (self.dictionary_name, generated_file)))
 
     def _dictionary_data(self):
         """ Generate dictionaries, coded as a Directed Acyclic Word Graph (DAWG),
             from the list of frequent words if those were submitted during the Trainer initialization.
+            Only the 'unicharset' file is needed, so that the dictionaries can be generated during the clustering.
         """
         if self.word_list:
-            cmd = 'wordlist2dawg %s %s.freq-dawg %s.unicharset' % (self.word_list, self.dictionary_name,
-                self.dictionary_name)
-            run = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            display_output(run, self.verbose)
+            cmd = ['wordlist2dawg', os.path.abspath(self.word_list), '%s.freq-dawg' % (self.dictionary_name), 'unicharset']
+            run_command(cmd, self.verbose, self.report, cwd=self.workspace.path)
+
+    def _optional_components(self):
+        """ Return the names of the {self.dictionary_name}.* component files which are not generated by the training """
+        generated = GENERATED_DURING_TRAINING + (['freq-dawg'] if self.word_list else [])
+        return ['%s.%s' % (self.dictionary_name, component) for component in COMPONENTS if component not in generated]
 
     def _combine_data(self):
-        cmd = 'combine_tessdata %s.' % (self.dictionary_name)
-        run = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        display_output(run, self.verbose)
-
-    def training(self):
-        """ Execute all training steps """
-        self._generate_boxfile()
-        self._train_on_boxfile()
-        self._compute_character_set()
-        self._clustering()
-        self._normalize()
-        self._rename_files()
-        self._dictionary_data()
-        self._combine_data()
+        """ Pack the {self.dictionary_name}.* component files into the {self.dictionary_name}.traineddata file,
+            along with the optional ones of self.components_dir
+        """
+        if self.components_dir != self.workspace.path:
+            # the copies mirror self.components_dir: a component file removed from it is not packed anymore
+            for name in self._optional_components():
+                path = os.path.join(self.components_dir, name)
+                if exists(path):
+                    shutil.copyfile(path, self.workspace.join(name))
+                elif exists(self.workspace.join(name)):
+                    os.remove(self.workspace.join(name))
+        traineddata = '%s.traineddata' % (self.dictionary_name)
+        components = pack_traineddata(self.workspace.join('%s.' % (self.dictionary_name)), self.workspace.join(traineddata))
+        if self.verbose:
+            print('Packed %s into %s' % (', '.join(components), traineddata))
+
+    def _font_trainers(self):
+        """ Return the trainers generating the multipage tifs and boxfiles, one per training font """
+        return [self]
+
+    def _stages(self):
+        """ Return the list of training steps, along with the files each one reads and writes,
+            and the other parameters its outputs depend on.
+        """
+        join = self.workspace.join
+        tifs = [join('%s.tif' % (prefix)) for prefix in self.prefixes]
+        boxfiles = [join('%s.box' % (prefix)) for prefix in self.prefixes]
+        trfiles = [join('%s.tr' % (prefix)) for prefix in self.prefixes]
+        generated_files = [join(generated_file) for generated_file in GENERATED_DURING_TRAINING]
+        dictionary_files = [join('%s.%s' % (self.dictionary_name, generated_file))
+            for generated_file in GENERATED_DURING_TRAINING]
+        stages = []
+        if self.sample is not None:
+            stages.append(Stage('sample', self._sample_training_text,
+                inputs=[self.text],
+                outputs=[self.sample_text, self.coverage_path],
+                params=[__version__, self.sample, self.sample_bigrams, self.max_glyphs]))
+        stages += [
+            Stage('boxfile', self._generate_boxfile,
+                inputs=[self._training_text_path()] + [trainer.font_path for trainer in self._font_trainers()],
+                outputs=tifs + boxfiles,
+                params=[__version__, self.prefixes, [trainer.font_size for trainer in self._font_trainers()],
+                    [multipage_tif.Offset_x0, multipage_tif.Offset_y0, multipage_tif.Offset_x1, multipage_tif.Offset_y1],
+                    self._page_layout().params(), self.bilevel,
+                    [trainer.degradation.params() if trainer.degradation else None for trainer in self._font_trainers()]]),
+            Stage('box.train', self._train_on_boxfile,
+                inputs=tifs + boxfiles,
+                outputs=trfiles,
+                params=[tool_fingerprint('tesseract')]),
+            Stage('unicharset', self._compute_character_set,
+                inputs=boxfiles,
+                outputs=[join('unicharset')],
+                params=[__version__]),
+            Stage('mftraining', self._clustering,
+                inputs=[self.font_properties, join('unicharset')] + trfiles,
+                outputs=[join('inttemp'), join('pffmtable'), join('shapetable')],
+                params=[tool_fingerprint('mftraining')]),
+            Stage('cntraining', self._normalize,
+                inputs=trfiles,
+                outputs=[join('normproto')],
+                params=[tool_fingerprint('cntraining')]),
+            Stage('rename', self._rename_files,
+                inputs=generated_files,
+                outputs=dictionary_files),
+        ]
+        if self.word_list:
+            stages.append(Stage('dawg', self._dictionary_data,
+                inputs=[self.word_list, join('unicharset')],
+                outputs=[join('%s.freq-dawg' % (self.dictionary_name))],
+                params=[tool_fingerprint('wordlist2dawg')]))
+            dictionary_files.append(join('%s.freq-dawg' % (self.dictionary_name)))
+        # the optional component files (config, unicharambigs...) of self.components_dir are packed as well
+        component_files = [os.path.join(self.components_dir, name) for name in self._optional_components()]
+        stages.append(Stage('combine', self._combine_data,
+            inputs=dictionary_files + [path for path in component_files if exists(path)],
+            outputs=[join('%s.traineddata' % (self.dictionary_name))],
+            params=[__version__]))
+        return stages
+
+    def training(self, resume=False, force_stages=()):
+        """ Execute all training steps, running the steps which do not depend on each other concurrently.
+            If 'resume' is True, the steps whose outputs are up to date with their inputs
+            (as recorded by a previous training) are skipped, except for the ones named in 'force_stages'.
+            If a report path was given, the timings and resource usage of the training are written to it,
+            even if the training fails. Likewise, if the training text is sampled, its coverage is copied
+            to the current directory.
+            The traineddata file is then copied from the workspace to the current directory.
+        """
+        try:
+            run_stages(self._stages(), self.manifest, self.report, resume, force_stages, self.verbose)
+        finally:
+            if self.report_path:
+                self.report.write(self.report_path)
+            if self.sample is not None and exists(self.coverage_path):
+                self.workspace.promote(os.path.basename(self.coverage_path))
+        self.workspace.promote('%s.traineddata' % (self.dictionary_name))
         if self.verbose:
             print('The %s.traineddata file has been generated !' % (self.dictionary_name))
 
+    def _written_files(self):
+        """ Return the paths of the workspace files written by the training, except for the traineddata and
+            coverage files when the workspace is the current directory, these files being promoted there
+        """
+        paths = set(path for stage in self._stages() for path in stage.outputs)
+        paths.update([self.manifest.path, self.manifest.path + '.tmp'])
+        paths.update(self.workspace.join('%s.txt' % (prefix)) for prefix in self.prefixes)  # box.train output
+        paths.update(self.workspace.join(name) for name in ('Microfeat', 'mfunicharset'))  # mftraining outputs
+        if self.components_dir != self.workspace.path:
+            paths.update(self.workspace.join(name) for name in self._optional_components())
+        if self.workspace.path == os.path.abspath('.'):
+            paths.discard(self.workspace.join('%s.traineddata' % (self.dictionary_name)))
+            paths.discard(self.coverage_path)
+        return sorted(paths)
+
     def clean(self):
-        """ Remove all files generated during tesseract training process """
+        """ Remove all files generated during tesseract training process, by removing the workspace.
+            A workspace directory given by the caller is kept: only the files written by the training are removed.
+        """
         if self.verbose:
-            print('cleaning...')
-        os.remove('%s.tr' % (self.prefix))
-        os.remove('%s.txt' % (self.prefix))
-        os.remove('%s.box' % (self.prefix))
-        os.remove('%s.inttemp' % (self.dictionary_name))
-        os.remove('%s.Microfeat' % (self.dictionary_name))
-        os.remove('%s.normproto' % (self.dictionary_name))
-        os.remove('%s.pffmtable' % (self.dictionary_name))
-        os.remove('%s.unicharset' % (self.dictionary_name))
-        if self.word_list:
-            os.remove('%s.freq-dawg' % (self.dictionary_name))
-        os.remove('mfunicharset')
+            print('cleaning %s...' % (self.workspace.path))
+        self.workspace.remove(self._written_files())
 
     def add_trained_data(self):
-        """ Copy the newly trained data to the tessdata/ directory """
+        """ Copy the newly trained data to the tessdata/ directory.
+            The traineddata file already installed, if any, is atomically replaced once the new one is copied.
+        """
         traineddata = '%s.traineddata' % (self.dictionary_name)
         if self.verbose:
             print('Copying %s to %s.' % (traineddata, self.tessdata_path))
         try:
-            shutil.copyfile(traineddata, join(self.tessdata_path, traineddata))  # Copy traineddata fie to the tessdata dir
-        except IOError:
+            install_traineddata(traineddata, self.tessdata_path)  # Copy traineddata fie to the tessdata dir
+        except (IOError, OSError):
             raise IOError("Permission denied. Super-user rights are required to copy %s to %s." % (traineddata, self.tessdata_path))
 
 
-def display_output(run, verbose):
-    """ Display the output/error of a subprocess.Popen object
-        if 'verbose' is True.
+class MultiFontTrainer(TesseractTrainer):
+    """ Object handling the training process of tesseract on several fonts at once.
+
+        The tif generation and tesseract box training of the fonts run concurrently, on 'jobs'
+        processes. The character set and clustering are then computed over the boxfiles
+        and training files of all fonts.
+
+        Each font can also be swept over several sizes and page degradations: one tif and boxfile
+        is then generated per (font, size, degradation) variant, with consecutive experience numbers.
+    """
+
+    def __init__(self,
+        dictionary_name,
+        text,
+        fonts,
+        font_properties,
+        font_sizes=None,
+        degradations=(),
+        **kwargs):
+
+        if not fonts:
+            raise SystemExit("At least one training font is required. Aborting.")
+        # the fonts and degradations are checked before the workspace is created
+        for font_name, font_path, _ in fonts:
+            check_font(font_name, font_path, font_properties)
+        if len(set(font_name for font_name, _, _ in fonts)) != len(fonts):
+            raise SystemExit("The training fonts must have distinct names. Aborting.")
+        degradations = [parse_degradation(degradation) if isinstance(degradation, basestring) else degradation
+            for degradation in degradations]
+
+        # The first font is used to initialize the training settings, shared by all fonts
+        font_name, font_path, font_size = fonts[0]
+        TesseractTrainer.__init__(self, dictionary_name, text, font_name, font_path, font_properties,
+            font_size=font_size, **kwargs)
+
+        # Sizes each font is rendered at (in px). If None, each font is rendered at its own size.
+        self.font_sizes = font_sizes
+
+        # Degradations (given as Degradation or "name=value,..." strings) each font is also rendered with,
+        # in addition to the undegraded rendering
+        self.degradations = degradations
+
+        # One trainer per (font_name, font_path, font_size, degradation) variant, generating and training on its
+        # own tif. The variants of a font are numbered from exp_number.
+        self.font_trainers = []
+        for font_name, font_path, font_size in fonts:
+            variants = [(size, degradation) for size in (font_sizes or [font_size])
+                for degradation in [self.degradation] + self.degradations]
+            for variant_nb, (size, degradation) in enumerate(variants):
+                self.font_trainers.append(self._font_trainer(font_name, font_path, size, self.exp_number + variant_nb,
+                    degradation))
+
+        self.prefixes = [trainer.prefix for trainer in self.font_trainers]
+
+    def _font_trainer(self, font_name, font_path, font_size, exp_number=None, degradation=None):
+        """ Return a trainer sharing all training settings, except for the font, experience number
+            and degradation
+        """
+        trainer = copy.copy(self)
+        trainer.font_name = font_name
+        trainer.font_path = font_path
+        trainer.font_size = font_size
+        trainer._check_font()
+        trainer.exp_number = exp_number if exp_number is not None else self.exp_number
+        trainer.degradation = degradation
+        trainer.prefix = '%s.%s.exp%s' % (self.dictionary_name, font_name, str(trainer.exp_number))
+        trainer.prefixes = [trainer.prefix]
+        trainer.jobs = 1  # fonts are already processed in parallel
+        return trainer
+
+    def _font_trainers(self):
+        return self.font_trainers
+
+    def _generate_boxfile(self):
+        """ Generate the multipage tif and boxfile of each font, in parallel.
+            The training text is only read and split into words once, for all fonts (unless streaming),
+            and the fonts opened by each process are shared by its variants of the same size.
+        """
+        training_words = None if self.streaming else self._training_words()
+        if self.jobs > 1:
+            # the trainers and words are inherited by the forked processes, only the trainer indexes are sent
+            pool = multiprocessing.Pool(min(self.jobs, len(self.font_trainers)), _init_boxfile_worker,
+                (self.font_trainers, training_words))
+            try:
+                # the timings and character set of each font tif generation are recorded in the worker processes
+                results = pool.map(_generate_font_boxfile, range(len(self.font_trainers)), chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+            for trainer, (phases, unicharset) in zip(self.font_trainers, results):
+                self.report.phases.extend(phases)
+                self.unicharsets[trainer.prefix] = unicharset
+        else:
+            for trainer in self.font_trainers:
+                TesseractTrainer._generate_boxfile(trainer, training_words)
+
+    def _train_on_boxfile(self):
+        """ Run tesseract on training mode on the multipage tif and boxfile of each font, in parallel """
+        pool = ThreadPool(max(1, min(self.jobs, len(self.font_trainers))))
+        try:
+            pool.map(self.report.bind(lambda trainer: TesseractTrainer._train_on_boxfile(trainer)), self.font_trainers)
+        finally:
+            pool.close()
+            pool.join()
+
+
+# Boxfile generation processes
+_boxfile_trainers = None  # font trainers whose boxfiles are generated by the current process
+_boxfile_words = None  # words of the training text, or None if each trainer reads it
+
+
+def _init_boxfile_worker(trainers, training_words):
+    """ Initialize a boxfile generation process with the font trainers and the training text words """
+    global _boxfile_trainers, _boxfile_words
+    _boxfile_trainers, _boxfile_words = trainers, training_words
+
+
+def _generate_font_boxfile(trainer_nb):
+    """ Generate the multipage tif and boxfile of a font trainer, and return the timings recorded meanwhile,
+        along with the character set of the boxfile
+    """
+    trainer = _boxfile_trainers[trainer_nb]
+    phase_count = len(trainer.report.phases)
+    TesseractTrainer._generate_boxfile(trainer, _boxfile_words)
+    return trainer.report.phases[phase_count:], trainer.unicharsets[trainer.prefix]
+
+
+def check_font(font_name, font_path, font_properties):
+    """ Abort if a training font name or path is not valid, or if its properties are not in 'font_properties' """
+    if ' ' in font_name:
+        raise SystemExit("The --font-name / -F argument must not contain any spaces. Aborting.")
+    if not exists(font_path):
+        raise SystemExit("The %s file does not exist. Aborting." % (font_path))
+    with open(font_properties, 'r') as fp:
+        if font_name not in fp.read().split():
+            raise SystemExit("The font properties of %s have not been defined in %s. Aborting." % (font_name, font_properties))
+
+
+def read_fonts(fonts_path, font_size=FONT_SIZE):
+    """ Read a list of training fonts from a file containing one font per line, of the form
+        "font_name font_path [font_size]". Blank lines and lines starting with '#' are ignored.
+        Return a list of (font_name, font_path, font_size) tuples.
+    """
+    fonts = []
+    with open(fonts_path, 'r') as fonts_file:
+        for line in fonts_file:
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            if len(fields) not in (2, 3):
+                raise SystemExit("Invalid font definition in %s: %s. Aborting." % (fonts_path, line.strip()))
+            fonts.append((fields[0], fields[1], int(fields[2]) if len(fields) == 3 else font_size))
+    return fonts
+
+
+def run_command(cmd, verbose, report, cwd=None):
+    """ Run a command (given as a list of arguments) in the 'cwd' directory, and display its output/error
+        line by line as it is produced, if 'verbose' is True.
+        Its wall time, CPU time and peak memory usage are recorded in 'report'.
+        Abort if the command fails.
     """
-    out, err = run.communicate()
-    if verbose:
-        print out.strip()
-        if err:
-            print err.strip()
+    start_time = time.time()
+    try:
+        run = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd)
+    except OSError as error:
+        raise SystemExit("Could not run %s: %s. Aborting." % (cmd[0], error.strerror))
+    # registered in the report, so that the command is terminated if another stage fails
+    report.command_started(run)
+    try:
+        # both pipes are read as the command runs, so that neither can fill up and block it
+        readers = [threading.Thread(target=_display_lines, args=(pipe, cmd[0], verbose))
+            for pipe in (run.stdout, run.stderr)]
+        for reader in readers:
+            reader.start()
+        for reader in readers:
+            reader.join()
+        # wait for the command ourselves, to get its resource usage
+        _, status, rusage = os.wait4(run.pid, 0)
+    finally:
+        report.command_exited(run)
+    run.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    report.command(' '.join(cmd), time.time() - start_time, rusage, run.returncode)
+    if run.returncode != 0:
+        stage = report.current_stage()
+        raise SystemExit("The %s stage failed: %s exited with code %d. Aborting." % (
+            stage['name'] if stage is not None else cmd[0], cmd[0], run.returncode))
+
+
+_display_lock = threading.Lock()  # keeps the lines of concurrent commands from being interleaved
+
+
+def _display_lines(pipe, name, verbose):
+    """ Read a command output pipe until it is closed, displaying each line if 'verbose' is True """
+    for line in iter(pipe.readline, b''):
+        if verbose:
+            with _display_lock:
+                sys.stdout.write('[%s] %s\n' % (name, line.rstrip()))
+    pipe.close()
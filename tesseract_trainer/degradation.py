@@ -0,0 +1,111 @@
+"""
+Degradations of the rendered tif pages: slight rotation, blur and noise, so that tesseract is
+trained on pages looking more like scanned ones.
+
+A degradation is applied to each greyscale page once its characters are drawn, and the boxes
+of the characters are moved along with them.
+The degraded pages only depend on the degradation settings and on the page number, so that
+the pages rendered by different processes are the same.
+"""
+
+import math
+import random
+
+from PIL import Image
+from PIL import ImageChops
+from PIL import ImageFilter
+
+
+NOISE_TILE = 256  # Size of the square noise patterns tiled over the pages (in px)
+
+
+class Degradation(object):
+    """ Rotation, blur and noise applied to the tif pages """
+
+    def __init__(self, rotate=0.0, blur=0.0, noise=0, seed=0):
+
+        # Counter-clockwise rotation of the pages around their center (in degrees)
+        self.rotate = rotate
+
+        # Radius of the gaussian blur of the pages (in px)
+        self.blur = blur
+
+        # Maximum grey level variation randomly added to each pixel (from 0 to 128)
+        self.noise = noise
+
+        # Seed of the noise patterns: the noise of a page only depends on it and on the page number
+        self.seed = seed
+
+    def __nonzero__(self):
+        return bool(self.rotate or self.blur or self.noise)
+
+    def params(self):
+        """ Return the settings the degraded pages depend on """
+        return [self.rotate, self.blur, self.noise, self.seed]
+
+    def apply(self, page, page_nb):
+        """ Return the degraded version of a greyscale page, with a white background """
+        if self.rotate:
+            # the corners uncovered by the rotation are filled with black, hence the inversions
+            page = ImageChops.invert(ImageChops.invert(page).rotate(self.rotate, Image.BILINEAR))
+        if self.blur:
+            page = page.filter(ImageFilter.GaussianBlur(self.blur))
+        if self.noise:
+            if not self.rotate and not self.blur:
+                page = page.copy()  # the noise is added in place
+            self._add_noise(page, page_nb)
+        return page
+
+    def _add_noise(self, page, page_nb):
+        """ Add a random noise pattern, tiled over the whole page, to its pixels """
+        rng = random.Random(self.seed * 1000003 + page_nb)
+        levels = bytearray(rng.randint(128 - self.noise, 128 + self.noise) for _ in range(NOISE_TILE * NOISE_TILE))
+        noise = Image.frombytes("L", (NOISE_TILE, NOISE_TILE), bytes(levels))
+        width, height = page.size
+        for y in range(0, height, NOISE_TILE):
+            for x in range(0, width, NOISE_TILE):
+                box = (x, y, min(x + NOISE_TILE, width), min(y + NOISE_TILE, height))
+                tile = page.crop(box)
+                page.paste(ImageChops.add(tile, noise.crop((0, 0) + tile.size), 1.0, -128), box)
+
+    def box(self, box, page_size):
+        """ Return the (x0, y0, x1, y1) box (PIL coordinates) bounding the argument character box
+            once the page is degraded, or None if the character is (even partly) out of the page,
+            before or after it is rotated
+        """
+        if not self.rotate:
+            return box
+        x0, y0, x1, y1 = box
+        width, height = page_size
+        if x0 < 0 or y0 < 0 or x1 > width or y1 > height:
+            return None  # the character is not entirely drawn, and would be rotated along with its cut
+        center_x, center_y = width / 2.0, height / 2.0
+        cos, sin = math.cos(math.radians(self.rotate)), math.sin(math.radians(self.rotate))
+        corners = [(center_x + (x - center_x) * cos + (y - center_y) * sin,
+                    center_y - (x - center_x) * sin + (y - center_y) * cos) for x in (x0, x1) for y in (y0, y1)]
+        xs, ys = [x for x, _ in corners], [y for _, y in corners]
+        if min(xs) < 0 or min(ys) < 0 or max(xs) > width or max(ys) > height:
+            return None
+        # rounded outwards, and kept inside the page
+        x0, y0 = max(0, int(math.floor(min(xs)))), max(0, int(math.floor(min(ys))))
+        x1, y1 = min(width, max(x0, int(math.ceil(max(xs))))), min(height, max(y0, int(math.ceil(max(ys)))))
+        return x0, y0, x1, y1
+
+
+def parse_degradation(spec):
+    """ Return the Degradation described by a "name=value,..." string, the names being
+        rotate, blur, noise and seed (ex: "rotate=0.5,noise=20")
+    """
+    settings = {}
+    for setting in spec.split(','):
+        name, _, value = setting.partition('=')
+        name = name.strip()
+        try:
+            if name not in ('rotate', 'blur', 'noise', 'seed'):
+                raise ValueError
+            settings[name] = int(value) if name in ('noise', 'seed') else float(value)
+        except ValueError:
+            raise SystemExit("Invalid degradation %s: expected rotate=DEGREES,blur=RADIUS,noise=LEVEL,seed=SEED. Aborting." % (spec))
+    if not 0 <= settings.get('noise', 0) <= 128:
+        raise SystemExit("Invalid degradation %s: the noise level must be between 0 and 128. Aborting." % (spec))
+    return Degradation(**settings)
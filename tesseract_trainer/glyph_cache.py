@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+"""
+Cache of the glyph metrics needed to lay out the training text:
+advance, size, baseline offset and box offsets (including the custom offsets)
+of each character, resolved once per (font file hash, font size, character).
+
+The cache can optionally be persisted to disk, so that successive trainings
+using the same font do not have to query FreeType again.
+
+The glyph atlas holds the rasterized bitmap of each character, so that a glyph
+is only rendered once by FreeType, however many times it is drawn.
+"""
+
+import hashlib
+import os
+
+from collections import namedtuple
+from PIL import Image
+from PIL import ImageDraw
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+# advance: horizontal space taken by the character (in px)
+# width, height: size of the character (in px)
+# offset: offset of the character relative to the font baseline
+# box: (x0, y0, x1, y1) box of the character, relative to the position it is drawn at,
+#      adjusted for the font baseline and the custom offsets
+GlyphMetrics = namedtuple('GlyphMetrics', ['advance', 'width', 'height', 'offset', 'box'])
+
+# Greyscale glyph to black & white mask conversion table: pixels darker than mid-grey are drawn
+BILEVEL_MASK_TABLE = [255] * 128 + [0] * 128
+
+
+class GlyphCache(object):
+    """ Per-character metrics of a font at a given size, computed on demand. """
+
+    def __init__(self, font, font_path, fontsize, offsets, cache_path=None):
+
+        # FreeType font used to compute the metrics
+        self.font = font
+
+        # Custom (x0, y0, x1, y1) offset tables, mapping a character to a box correction (in px)
+        self.offsets = offsets
+
+        # Hash of the font file content, so that a cache can't be reused with a different font
+        self.font_hash = file_digest(font_path)
+
+        # Font size (in px) the metrics are computed for
+        self.fontsize = fontsize
+
+        # Path of the file the cache is persisted to. If None, the cache only lives in memory.
+        self.cache_path = cache_path
+
+        # All known metrics, keyed by (font file hash, font size, character)
+        self.metrics = {}
+
+        # Set to True when metrics were computed since the cache was loaded
+        self.modified = False
+
+        if self.cache_path and os.path.exists(self.cache_path):
+            self.load()
+
+    def __getitem__(self, char):
+        """ Return the GlyphMetrics of the argument character """
+        key = (self.font_hash, self.fontsize, char)
+        try:
+            return self.metrics[key]
+        except KeyError:
+            glyph = self.metrics[key] = self._compute(char)
+            self.modified = True
+            return glyph
+
+    def _compute(self, char):
+        """ Compute the metrics of a character with FreeType, and merge the custom offsets into its box """
+        char_w, char_h = self.font.getsize(char)  # get character height / width
+        offset = self.font.getoffset(char)  # this accounts for the font baseline relation
+        offset_x0, offset_y0, offset_x1, offset_y1 = [table.get(char, 0) for table in self.offsets]
+        box = (
+            offset[0] + offset_x0,
+            offset[1] + offset_y0 - 1,
+            char_w + offset[0] + offset_x1,
+            char_h + 1 + offset[1] + offset_y1 - 1,  # there seems to be a 1 pixel bias on the height
+        )
+        return GlyphMetrics(char_w, char_w, char_h, offset, box)
+
+    def word_size(self, word):
+        """ Return the (width, height) of a word: the sum of its characters advances
+            and the height of its highest character.
+        """
+        glyphs = [self[char] for char in word]
+        return sum(glyph.advance for glyph in glyphs), max(glyph.height for glyph in glyphs)
+
+    def load(self):
+        """ Load the metrics persisted in self.cache_path.
+            The persisted metrics are discarded if they were computed with different custom offsets.
+        """
+        with open(self.cache_path, 'rb') as cache_file:
+            persisted = pickle.load(cache_file)
+        if persisted['offsets'] == self.offsets:
+            for key, glyph in persisted['metrics'].items():
+                self.metrics.setdefault(key, glyph)
+
+    def save(self):
+        """ Persist the metrics to self.cache_path, if new ones were computed """
+        if not self.cache_path or not self.modified:
+            return
+        if os.path.exists(self.cache_path):
+            self.load()  # keep the metrics persisted in the meantime, e.g. by a training on another font
+        tmp_path = '%s.%d.tmp' % (self.cache_path, os.getpid())
+        with open(tmp_path, 'wb') as cache_file:
+            pickle.dump({'offsets': self.offsets, 'metrics': self.metrics}, cache_file, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, self.cache_path)  # never leave a half-written cache behind
+        self.modified = False
+
+
+class GlyphAtlas(object):
+    """ Bitmap of each character of a font, rasterized on demand. """
+
+    def __init__(self, font, bilevel=False):
+
+        # FreeType font the glyphs are rasterized with
+        self.font = font
+
+        # Set bilevel to True to draw the glyphs on black & white ("1") tifs: the masks are then thresholded
+        # once per character, instead of thresholding each page after drawing its characters
+        self.bilevel = bilevel
+
+        # Character -> (mask, (x, y) offset of the mask relative to the position the character is drawn at).
+        # The mask is None for characters without any visible pixel.
+        self.glyphs = {}
+
+    def __getitem__(self, char):
+        """ Return the (mask, offset) of the argument character """
+        try:
+            return self.glyphs[char]
+        except KeyError:
+            glyph = self.glyphs[char] = self._rasterize(char)
+            return glyph
+
+    def _rasterize(self, char):
+        """ Rasterize a character into a greyscale mask, exactly as ImageDraw.text would draw it """
+        core_mask, offset = self.font.getmask2(char, "L")
+        width, height = core_mask.size
+        if width == 0 or height == 0:
+            return None, offset
+        mask = Image.new("L", (width, height), color=0)
+        ImageDraw.Draw(mask).text((-offset[0], -offset[1]), char, fill=255, font=self.font)
+        if self.bilevel:
+            # the pixels becoming black when the glyph is drawn on a white page, and the page thresholded
+            glyph = Image.new("L", (width, height), color=255)
+            glyph.paste(0, (0, 0), mask)
+            mask = glyph.point(BILEVEL_MASK_TABLE, "1")
+        return mask, offset
+
+    def draw(self, tif, char, x_pos, y_pos, color=0):
+        """ Draw a character at (x_pos, y_pos) on the argument greyscale (or black & white, if bilevel) tif.
+            The pixels are the same as the ones drawn by ImageDraw.text: like it, the position
+            is truncated to whole pixels and the mask is blended with 'color'.
+        """
+        mask, (offset_x, offset_y) = self[char]
+        if mask is not None:
+            tif.paste(color, (int(x_pos + offset_x), int(y_pos + offset_y)), mask)
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """ Return the SHA-1 hex digest of a file content """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,346 @@
+"""
+Queue of training jobs, shared by a coordinator and worker processes through a spool directory.
+
+Each job is a JSON file, moved from one state directory of the spool to another:
+
+    pending/  jobs waiting for a worker
+    running/  jobs claimed by a worker. The worker touches the job file while it runs it,
+              so that the job of a worker which died can be detected and retried.
+    done/     jobs whose training succeeded
+    failed/   jobs which failed max_attempts times
+
+Moving a file within a directory tree is atomic, so that a job is only ever claimed by one worker,
+and all the state of the queue is on disk: the coordinator and the workers can be stopped
+and restarted at any time. The training reports of the jobs are written to reports/, and
+the output of each attempt to logs/.
+"""
+
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+from os.path import exists, join
+
+
+MAX_ATTEMPTS = 3  # Default number of times a job is run before it is considered failed
+CONCURRENCY = 1  # Default number of jobs a worker runs at the same time
+POLL_INTERVAL = 2.0  # Default number of seconds between two checks of the spool
+LEASE = 120.0  # Default number of seconds after which a running job whose file was not updated is retried.
+               # It must be longer than the poll interval of the workers, which update the files at each poll.
+
+STATES = ['pending', 'running', 'done', 'failed']
+
+# Training parameters holding paths, made absolute when the jobs are submitted
+PATH_KEYS = ['text', 'font_path', 'font_properties', 'tessdata_path', 'word_list', 'glyph_cache', 'workspace',
+    'profile', 'report', 'directory', 'components_dir']
+
+
+class Spool(object):
+    """ Spool directory holding the jobs of a queue """
+
+    def __init__(self, path):
+
+        # Path of the spool directory
+        self.path = os.path.abspath(path)
+
+        for directory in STATES + ['reports', 'logs', 'output']:
+            if not exists(join(self.path, directory)):
+                os.makedirs(join(self.path, directory))
+
+    def job_path(self, state, job_id):
+        return join(self.path, state, '%s.json' % (job_id))
+
+    def job_ids(self, state):
+        """ Return the ids of the jobs in the argument state, sorted """
+        return sorted(name[:-len('.json')] for name in os.listdir(join(self.path, state)) if name.endswith('.json'))
+
+    def state(self, job_id):
+        """ Return the state of a job, or None if it was never submitted """
+        for state in STATES:
+            if exists(self.job_path(state, job_id)):
+                return state
+        return None
+
+    def read(self, state, job_id):
+        with open(self.job_path(state, job_id), 'r') as job_file:
+            return json.load(job_file)
+
+    def write(self, state, job):
+        """ Write a job to the argument state directory. The job file is replaced once completely written. """
+        path = self.job_path(state, job['id'])
+        tmp_path = '%s.%s.%d.tmp' % (path, socket.gethostname(), os.getpid())
+        with open(tmp_path, 'w') as job_file:
+            json.dump(job, job_file, indent=1, sort_keys=True)
+        os.rename(tmp_path, path)
+
+    def move(self, job_id, from_state, to_state):
+        """ Atomically move a job from a state to another. Return False if the job was not in 'from_state'
+            anymore, because another process moved it.
+        """
+        try:
+            os.rename(self.job_path(from_state, job_id), self.job_path(to_state, job_id))
+        except OSError:
+            return False
+        return True
+
+    def submit(self, jobs):
+        """ Add the jobs which were never submitted to the pending jobs, and return their ids """
+        submitted = []
+        for job in jobs:
+            if self.state(job['id']) is None:
+                self.write('pending', job)
+                submitted.append(job['id'])
+        return submitted
+
+    def claim(self, worker):
+        """ Move the first pending job to the running jobs, and return it, or None if no job is pending """
+        for job_id in self.job_ids('pending'):
+            if self.move(job_id, 'pending', 'running'):
+                job = self.read('running', job_id)
+                job['attempts'] += 1
+                job['history'].append({'worker': worker, 'started': time.time()})
+                self.write('running', job)
+                return job
+        return None
+
+    def heartbeat(self, job_id):
+        """ Mark a running job as still running """
+        try:
+            os.utime(self.job_path('running', job_id), None)
+        except OSError:
+            pass  # the job was retried meanwhile
+
+    def finish(self, job, succeeded, error=None):
+        """ Move a running job to the done jobs if it succeeded. Otherwise, move it back to the pending jobs
+            to be retried, or to the failed jobs once it failed job['max_attempts'] times.
+            Return the new state of the job.
+        """
+        # the running job file is first set aside, so that neither the coordinator nor another worker
+        # can move it meanwhile
+        running_path = self.job_path('running', job['id'])
+        finishing_path = '%s.%s.%d.finishing' % (running_path, socket.gethostname(), os.getpid())
+        try:
+            os.rename(running_path, finishing_path)
+        except OSError:
+            return None  # the job was retried meanwhile
+        with open(finishing_path, 'r') as job_file:
+            if json.load(job_file)['attempts'] != job['attempts']:
+                os.rename(finishing_path, running_path)  # the job was retried, and claimed again meanwhile
+                return None
+
+        attempt = job['history'][-1]
+        attempt['finished'] = time.time()
+        attempt['wall_time'] = attempt['finished'] - attempt['started']
+        attempt['error'] = error
+        if succeeded:
+            state = 'done'
+        elif job['attempts'] < job['max_attempts']:
+            state = 'pending'
+        else:
+            state = 'failed'
+        self.write(state, job)
+        os.remove(finishing_path)
+        return state
+
+    def recover(self, lease=LEASE):
+        """ Retry the running jobs whose file was not updated for 'lease' seconds: their worker died.
+            Return the ids of the recovered jobs.
+        """
+        recovered = []
+        for job_id in self.job_ids('running'):
+            try:
+                if time.time() - os.path.getmtime(self.job_path('running', job_id)) < lease:
+                    continue
+                job = self.read('running', job_id)
+            except (OSError, IOError, ValueError):
+                continue  # the job finished meanwhile
+            if self.finish(job, False, 'The worker stopped updating the job for %d seconds.' % (lease)):
+                recovered.append(job_id)
+        return recovered
+
+    def status(self):
+        """ Return the number of jobs in each state """
+        return dict((state, len(self.job_ids(state))) for state in STATES)
+
+
+def read_jobs(manifest_path):
+    """ Read a job manifest: a JSON list of jobs, or a {"defaults": {...}, "jobs": [...]} object whose
+        defaults apply to all jobs.
+        Each job holds the TesseractTrainer parameters (plus "fonts", "font_sizes" or "degradations",
+        to train a MultiFontTrainer), along with:
+            - id: the job identifier. Defaults to {dictionary_name}.{font_name}.{font_size}.exp{exp_number}.
+            - max_attempts: the number of times the job is run before it is considered failed.
+            - install: set to true to copy the traineddata file to the tessdata directory.
+            - directory: the directory the traineddata file is written to. Defaults to the spool output/{id} directory.
+        A job "workspace" must not be shared with another job.
+        Relative paths are relative to the manifest directory.
+    """
+    with open(manifest_path, 'r') as manifest:
+        content = json.load(manifest)
+    if isinstance(content, list):
+        content = {'jobs': content}
+    base_path = os.path.dirname(os.path.abspath(manifest_path))
+
+    jobs = []
+    for entry in content.get('jobs', []):
+        params = dict(content.get('defaults', {}), **entry)
+        for key in PATH_KEYS:
+            if params.get(key) is not None:
+                params[key] = join(base_path, params[key])
+        if isinstance(params.get('fonts'), list):
+            params['fonts'] = [[font[0], join(base_path, font[1])] + list(font[2:]) for font in params['fonts']]
+        elif params.get('fonts') is not None:
+            params['fonts'] = join(base_path, params['fonts'])
+        job_id = params.pop('id', None) or '%s.%s.%s.exp%s' % (params.get('dictionary_name'),
+            params.get('font_name', 'fonts'), params.get('font_size', 'default'), params.get('exp_number', 0))
+        jobs.append({
+            'id': job_id,
+            'max_attempts': params.pop('max_attempts', MAX_ATTEMPTS),
+            'install': params.pop('install', False),
+            'directory': params.pop('directory', None),
+            'trainer': params,
+            'attempts': 0,
+            'history': [],
+        })
+    if len(set(job['id'] for job in jobs)) != len(jobs):
+        raise SystemExit("The jobs of %s must have distinct ids. Aborting." % (manifest_path))
+    workspaces = [os.path.normpath(job['trainer']['workspace']) for job in jobs if job['trainer'].get('workspace')]
+    if len(set(workspaces)) != len(workspaces):
+        raise SystemExit("The jobs of %s must have distinct workspaces. Aborting." % (manifest_path))
+    return jobs
+
+
+def coordinate(spool, manifest_path=None, lease=LEASE, poll_interval=POLL_INTERVAL, verbose=True):
+    """ Submit the jobs of a manifest (the ones already submitted, by a previous coordinator, are kept as they are),
+        and wait for the workers to run all jobs, retrying the jobs of the workers which died.
+        Return the number of jobs in each state.
+    """
+    if manifest_path is not None:
+        submitted = spool.submit(read_jobs(manifest_path))
+        if verbose:
+            print('Submitted %d jobs to %s' % (len(submitted), spool.path))
+    status = None
+    while True:
+        for job_id in spool.recover(lease):
+            if verbose:
+                print('Retrying %s: its worker stopped' % (job_id))
+        if spool.status() != status:
+            status = spool.status()
+            if verbose:
+                print(' '.join('%s: %d' % (state, status[state]) for state in STATES))
+        if not status['pending'] and not status['running']:
+            return status
+        time.sleep(poll_interval)
+
+
+class Worker(object):
+    """ Process running the jobs of a spool, at most 'concurrency' at a time, each in its own process """
+
+    def __init__(self, spool, concurrency=CONCURRENCY, poll_interval=POLL_INTERVAL, verbose=True):
+
+        # Spool the jobs are pulled from
+        self.spool = spool
+
+        # Maximum number of jobs run at the same time
+        self.concurrency = concurrency
+
+        # Number of seconds between two checks of the spool, and of the running jobs
+        self.poll_interval = poll_interval
+
+        # Set verbose to True to display the jobs being run
+        self.verbose = verbose
+
+        # Identifier of the worker, recorded in the jobs it runs
+        self.name = '%s:%d' % (socket.gethostname(), os.getpid())
+
+        # Job id -> (job, process running it) of the jobs being run
+        self.running = {}
+
+    def run(self, exit_when_idle=False):
+        """ Run the pending jobs as they are submitted. If 'exit_when_idle' is True, return once
+            no job is pending nor running anymore.
+        """
+        try:
+            while True:
+                for job_id, (job, process) in list(self.running.items()):
+                    if not process.is_alive():
+                        process.join()
+                        self._finish(job, process.exitcode)
+                        del self.running[job_id]
+                for job_id in self.running:
+                    self.spool.heartbeat(job_id)
+                while len(self.running) < self.concurrency:
+                    job = self.spool.claim(self.name)
+                    if job is None:
+                        break
+                    self._start(job)
+                if exit_when_idle and not self.running and not self.spool.status()['running']:
+                    return
+                time.sleep(self.poll_interval)
+        finally:
+            for job, process in self.running.values():
+                process.terminate()  # their jobs are retried once their lease expires
+
+    def _start(self, job):
+        log_path = join(self.spool.path, 'logs', '%s.%d.log' % (job['id'], job['attempts']))
+        if self.verbose:
+            print('Running %s (attempt %d), logging to %s' % (job['id'], job['attempts'], log_path))
+        process = multiprocessing.Process(target=_run_job, args=(self.spool.path, job, log_path))
+        process.start()
+        job['history'][-1]['log'] = log_path
+        self.running[job['id']] = (job, process)
+
+    def _finish(self, job, exitcode):
+        error = None
+        if exitcode != 0:
+            # the last line of the output of a failed training is its error message
+            with open(job['history'][-1]['log'], 'r') as log:
+                lines = [line.strip() for line in log if line.strip()]
+            error = 'The training exited with code %d: %s' % (exitcode, lines[-1] if lines else '')
+        state = self.spool.finish(job, exitcode == 0, error)
+        if self.verbose:
+            print('%s: %s' % (job['id'], state or 'retried by the coordinator'))
+
+
+def _run_job(spool_path, job, log_path):
+    """ Run the training of a job in a worker child process, its output being written to 'log_path' """
+    from tesseract_trainer import TesseractTrainer, MultiFontTrainer, read_fonts, FONT_SIZE
+
+    log = open(log_path, 'a')
+    os.dup2(log.fileno(), sys.stdout.fileno())
+    os.dup2(log.fileno(), sys.stderr.fileno())
+
+    directory = job['directory'] or join(spool_path, 'output', job['id'])
+    if not exists(directory):
+        os.makedirs(directory)
+    os.chdir(directory)  # the traineddata file is written to the current directory
+
+    params = dict((str(key), value) for key, value in job['trainer'].items())
+    params.setdefault('report', join(spool_path, 'reports', '%s.json' % (job['id'])))
+    if 'fonts' in params:
+        font_size = params.pop('font_size', FONT_SIZE)
+        if isinstance(params['fonts'], list):
+            params['fonts'] = [(font[0], font[1], font[2] if len(font) > 2 else font_size) for font in params['fonts']]
+        else:
+            params['fonts'] = read_fonts(params['fonts'], font_size)
+        trainer = MultiFontTrainer(**params)
+    elif 'font_sizes' in params or 'degradations' in params:
+        params['fonts'] = [(params.pop('font_name'), params.pop('font_path'), params.pop('font_size', FONT_SIZE))]
+        trainer = MultiFontTrainer(**params)
+    else:
+        trainer = TesseractTrainer(**params)
+
+    # When the job has its own workspace, a failed attempt is resumed by the next one
+    keep_workspace = params.get('workspace') is not None
+    succeeded = False
+    try:
+        trainer.training(resume=keep_workspace)
+        if job['install']:
+            trainer.add_trained_data()
+        succeeded = True
+    finally:
+        if succeeded or not keep_workspace:
+            trainer.clean()
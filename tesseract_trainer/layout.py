@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+"""
+Layout of the training text into pages: position of each character on each page.
+
+PageLayout is the historical layout of TesseractTrainer. DensePageLayout packs the lines
+using their actual height, which fits more text on each page, hence fewer pages to render
+and to train on.
+"""
+
+
+class PageLayout(object):
+    """ Lays out the words line by line, a line being as high as the highest glyph of the word
+        starting it, and keeping room for two such lines at the bottom of the page.
+        The margins only set where the text starts: the text goes up to the right edge of the page.
+    """
+
+    default_leading = 40  # space between two lines (in px) when no leading is given
+
+    def __init__(self, width=3600, height=3600, margin_x=50, margin_y=50, leading=None, tracking=8.9):
+
+        # Size of the pages (in px)
+        self.width = width
+        self.height = height
+
+        # Position of the first letter of each page
+        self.margin_x = margin_x
+        self.margin_y = margin_y
+
+        # Space added between two lines (in px)
+        self.leading = leading if leading is not None else self.default_leading
+
+        # Space added after each character (in px)
+        self.tracking = tracking
+
+    def params(self):
+        """ Return the layout settings, as JSON serializable values """
+        return [self.__class__.__name__, self.width, self.height, self.margin_x, self.margin_y,
+            self.leading, self.tracking]
+
+    def pages(self, words, glyphs):
+        """ Lay out the (unicode) words, and yield each page as soon as it is finished,
+            as a list of (char, x, y) character placements, white spaces excluded.
+            'glyphs' is the GlyphCache of the font the words are written with.
+        """
+        page = []
+        x_pos = self.margin_x
+        y_pos = self.margin_y
+        for word in words:
+            word += ' '  # add a space between each word
+            wordsize_w, wordsize_h = glyphs.word_size(word)
+            # Check if word can fit the line, if not, newline
+            # if newline, check if the newline fits the page
+            # if not, start a new page
+            if not word_fits_in_line(self.width, x_pos, wordsize_w):
+                if newline_fits_in_page(self.height, y_pos, wordsize_h):
+                    # newline
+                    x_pos = self.margin_x
+                    y_pos += wordsize_h + self.leading
+                else:
+                    # newline AND newpage
+                    x_pos = self.margin_x
+                    y_pos = self.margin_y
+                    yield page
+                    page = []
+            # place word
+            for char in word:
+                if char != ' ':
+                    page.append((char, x_pos, y_pos))
+                x_pos += glyphs[char].advance + self.tracking
+        yield page
+
+
+class DensePageLayout(PageLayout):
+    """ Lays out the words line by line, each line being exactly as high as the boxes of its glyphs,
+        and the text staying within the margins on all sides of the page.
+    """
+
+    default_leading = 10  # the line height already includes the ascenders and descenders of the line
+
+    def pages(self, words, glyphs):
+        page = []
+        y_pos = self.margin_y
+        for line in self._lines(words, glyphs):
+            if not line:
+                continue
+            boxes = [glyphs[char].box for char, _ in line]
+            top = min(box[1] for box in boxes)
+            bottom = max(box[3] for box in boxes)
+            if page and y_pos - top + bottom > self.height - self.margin_y:
+                # newpage
+                yield page
+                page = []
+                y_pos = self.margin_y
+            # the top of the highest glyph box of the line is at y_pos
+            page.extend((char, x_pos, y_pos - top) for char, x_pos in line)
+            y_pos += bottom - top + self.leading
+        yield page
+
+    def _lines(self, words, glyphs):
+        """ Lay out the words into lines fitting between the left and right margins, and yield each line
+            as a list of (char, x) character placements, white spaces excluded.
+            A word wider than a line is placed alone on its line.
+        """
+        line = []
+        x_pos = self.margin_x
+        for word in words:
+            advances = [glyphs[char].advance + self.tracking for char in word]
+            if line and x_pos + sum(advances) > self.width - self.margin_x:
+                # newline
+                yield line
+                line = []
+                x_pos = self.margin_x
+            for char, advance in zip(word, advances):
+                if char != ' ':
+                    line.append((char, x_pos))
+                x_pos += advance
+            x_pos += glyphs[' '].advance + self.tracking  # add a space between each word
+        yield line
+
+
+def word_fits_in_line(pagewidth, x_pos, wordsize_w):
+    """ Return True if a word can fit into a line. """
+    return (pagewidth - x_pos - wordsize_w) > 0
+
+
+def newline_fits_in_page(pageheight, y_pos, wordsize_h):
+    """ Return True if a new line can be contained in a page. """
+    return (pageheight - y_pos - (2 * wordsize_h)) > 0
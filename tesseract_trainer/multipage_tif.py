@@ -11,10 +11,17 @@ UTF-8 encoded characters are supported.
 
 from PIL import Image
 from PIL import ImageFont
-from PIL import ImageDraw
-import glob
-import subprocess
+from PIL import TiffImagePlugin
+import collections
+import io
+import multiprocessing
 import os
+import subprocess
+
+from glyph_cache import GlyphAtlas, GlyphCache
+from layout import PageLayout, word_fits_in_line, newline_fits_in_page
+from report import RunReport, Stopwatch
+from unicharset import Unicharset
 
 Offset_x0 = {'0':-4}
 
@@ -24,12 +31,17 @@ Offset_y0 = {'0':-4}
 
 Offset_y1 = {'0':4}
 
+# Greyscale to black & white conversion table: pixels darker than mid-grey become black
+BILEVEL_TABLE = [0] * 128 + [255] * 128
+
 
 
 class MultiPageTif(object):
     """ A class allowing generation of a multi-page tif. """
 
-    def __init__(self, text, W, H, start_x, start_y, font_name, font_path, fontsize, exp_number, dictionary_name, verbose):
+    def __init__(self, text, W, H, start_x, start_y, font_name, font_path, fontsize, exp_number, dictionary_name, verbose,
+        glyph_cache=None, jobs=1, streaming=False, report=None, layout=None, directory='.', bilevel=False,
+        degradation=None):
 
         # Width of the generated tifs (in px)
         self.W = W
@@ -43,11 +55,35 @@ class MultiPageTif(object):
         # Y coordinate of the first letter of the page
         self.start_y = start_y
 
-        # Text to be written in generated multipage tif
-        self.text = [word.decode('utf-8') for word in text.split(' ')]  # utf-8 characters support
+        # Layout engine placing the characters on the pages. If None, the historical PageLayout
+        # is used, with the above page size and first letter position.
+        self.layout = layout if layout is not None else PageLayout(W, H, start_x, start_y)
+
+        # Text to be written in generated multipage tif: either a string, or an iterable
+        # of words (see iter_words), which is then only consumed as the pages are laid out
+        if isinstance(text, basestring):
+            text = text.split(' ')
+        self.text = (word.decode('utf-8') for word in text)  # utf-8 characters support
+
+        # Local path to the TrueType/OpenType file of the font, and font size (in px)
+        self.font_path = font_path
+        self.fontsize = fontsize
+
+        # Degradation (rotation, blur, noise) applied to the rendered pages, if any
+        self.degradation = degradation or None
+
+        # Set bilevel to True to render the pages directly in black & white, instead of rendering
+        # them in greyscale and thresholding them once complete. Degraded pages are always rendered in greyscale.
+        self.bilevel = bilevel and self.degradation is None
+
+        # Font used when "writing" the text into the tif, metrics of the font glyphs, resolved once per
+        # character and optionally persisted to the 'glyph_cache' file, and bitmaps of the font glyphs,
+        # rasterized once per character and pasted onto the pages.
+        # They are shared by all the tifs generated with the same font and size by the current process.
+        self.font, self.glyphs, self.atlas = load_font(font_path, fontsize, self.bilevel, glyph_cache)
 
-        # Font used when "writing" the text into the tif
-        self.font = ImageFont.truetype(font_path, fontsize)
+        # Blank page images, reused from one page to the next
+        self.buffers = PageBufferPool((W, H))
 
         # Name of the font, used for generating the file prefix
         self.font_name = font_name
@@ -58,117 +94,199 @@ class MultiPageTif(object):
         # Prefix of the generated multi-page tif file
         self.prefix = ".".join([dictionary_name, font_name, "exp" + str(exp_number)])
 
+        # Directory the multi-page tif and boxfile are written to, and path prefix of these files
+        self.directory = directory
+        self.path_prefix = os.path.join(directory, self.prefix)
+
         # A list of boxfile lines, each one of the form "char x0 y x1 y1 page_number"
         self.boxlines = []
 
-        # prefix of all temporary single-page tif files
-        self.indiv_page_prefix = 'page'
+        # Set streaming to True to write the boxfile lines of each page as soon as it is laid out,
+        # instead of keeping all of them in self.boxlines until generate_boxfile is called
+        self.streaming = streaming
 
         # Set verbose to True to display output
         self.verbose = verbose
 
+        # Number of processes rendering the pages in parallel
+        self.jobs = jobs
+
+        # Report the time spent laying out and rendering the pages is recorded into
+        self.report = report if report is not None else RunReport()
+
+        # Number of pages and characters (white spaces excluded) laid out so far,
+        # and area of the page covered by the character boxes (in px)
+        self.page_count = 0
+        self.glyph_count = 0
+        self.box_area = 0
+
+        # Characters laid out so far, from which the tesseract unicharset file is generated
+        self.unicharset = Unicharset()
+
+    def __getstate__(self):
+        """ Only send the page settings to the rendering processes: the font
+            is re-opened on the other side, and the text and glyph metrics are left out.
+        """
+        state = self.__dict__.copy()
+        del state['font'], state['glyphs'], state['atlas'], state['buffers'], state['report']
+        state['text'], state['boxlines'] = [], []
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.font, _, self.atlas = load_font(self.font_path, self.fontsize, self.bilevel)
+        self.buffers = PageBufferPool((self.W, self.H))
+
     def generate_tif(self):
-        """ Create several individual tifs from text and merge them
-            into a multi-page tif, and finally delete all individual tifs.
+        """ Lay out the text into pages, and render them into a multi-page tif.
+            In streaming mode, the boxfile is written along the way.
         """
-        self._fill_pages()
-        self._multipage_tif()
-        self._clean()
+        layout, rendering = Stopwatch(), Stopwatch()
+        pages = layout.iterate(self._fill_pages())
+        if self.streaming:
+            pages = self._stream_boxfile(pages)
+        with self.report.profiling(self.prefix), rendering.running():
+            self._multipage_tif(pages)
+        # the layout happens while the pages are being rendered
+        rendering.wall_time -= layout.wall_time
+        rendering.cpu_time -= layout.cpu_time
+        self.report.phase('fill_pages', layout, prefix=self.prefix, pages=self.page_count, glyphs=self.glyph_count,
+            fill_ratio=self.fill_ratio())
+        if self.verbose:
+            print('Laid out %d pages, %.1f%% of their area covered by character boxes' % (
+                self.page_count, 100 * self.fill_ratio()))
+        self.report.phase('multipage_tif', rendering, prefix=self.prefix, pages=self.page_count,
+            glyphs=self.glyph_count, bytes_written=os.path.getsize(self.path_prefix + '.tif'),
+            page_buffers=self.buffers.allocated)
 
     def generate_boxfile(self):
         """ Generate a boxfile from the multipage tif.
-            The boxfile will be named {self.prefix}.box
+            The boxfile will be named {self.directory}/{self.prefix}.box
+            In streaming mode, the boxfile has already been written by generate_tif.
         """
-        boxfile_path = self.prefix + '.box'
+        if self.streaming:
+            return
+        boxfile_path = self.path_prefix + '.box'
+        if self.verbose:
+            print("Generating boxfile %s" % (boxfile_path))
+        stopwatch = Stopwatch()
+        with stopwatch.running():
+            with open(boxfile_path, 'w') as boxfile:
+                self._write_boxlines(boxfile)
+        self.report.phase('generate_boxfile', stopwatch, prefix=self.prefix, glyphs=len(self.boxlines),
+            bytes_written=os.path.getsize(boxfile_path))
+
+    def _write_boxlines(self, boxfile):
+        """ Write all self.boxlines lines to the argument boxfile """
+        for boxline in self.boxlines:
+            boxfile.write(boxline.encode('utf-8') + '\n')  # utf-8 characters support
+
+    def _stream_boxfile(self, pages):
+        """ Pass the laid out pages through, and append the boxfile lines of each page
+            to {self.directory}/{self.prefix}.box as soon as the page is finished.
+        """
+        boxfile_path = self.path_prefix + '.box'
         if self.verbose:
             print("Generating boxfile %s" % (boxfile_path))
         with open(boxfile_path, 'w') as boxfile:
-            for boxline in self.boxlines:
-                boxfile.write(boxline.encode('utf-8') + '\n')  # utf-8 characters support
+            for placements in pages:
+                self._write_boxlines(boxfile)
+                del self.boxlines[:]
+                yield placements
 
     def _new_tif(self, color="white"):
-        """ Create and returns a new RGB blank tif, with specified background color (default: white) """
-        return Image.new("L", (self.W, self.H), color=color)
-
-    def _save_tif(self, tif, page_number):
-        """ Save the argument tif using 'page_number' argument in filename.
-            The filepath will be {self.indiv_page_prefix}{self.page_number}.tif
+        """ Return a blank tif, with specified background color (default: white): greyscale,
+            or black & white if self.bilevel. Once written, it should be given back with self.buffers.release.
         """
+        return self.buffers.acquire("1" if self.bilevel else "L", color)
+
+    def _save_tif(self, encoded_page, tif_writer):
+        """ Append the argument Group 4 encoded page as a new page of the multi-page tif written by 'tif_writer' """
         #tif = tif.rotate(-1,expand=True)
-        tif.save(self.indiv_page_prefix + str(page_number) + '.tif',dpi=(300,300))
+        tif_writer.append_encoded(encoded_page)
 
     def _fill_pages(self):
-        """ Fill individual tifs with text, and save them to disk.
-            Each time a character is written in the tif, its coordinates will be added to the self.boxlines
+        """ Lay out the text into pages with self.layout, and yield each page as soon as it is finished,
+            as a list of (char, x, y) character placements.
+            Each time a character is placed on a page, its coordinates will be added to the self.boxlines
             list (with the exception of white spaces).
-
-            All along the process, we manage to contain the text within the image limits.
+            Characters which a degradation would move (even partly) out of the page are left out.
+        """
+        for page_nb, page in enumerate(self.layout.pages(self.text, self.glyphs)):
+            placements = []
+            for char, x_pos, y_pos in page:
+                # character box, adjusted for font baseline location, and custom offsets needed for bad sizing
+                box_x0, box_y0, box_x1, box_y1 = self.glyphs[char].box
+                char_x0, char_y0, char_x1, char_y1 = x_pos + box_x0, y_pos + box_y0, x_pos + box_x1, y_pos + box_y1
+                if self.degradation is not None:
+                    # the character moves along with the degraded page
+                    char_box = self.degradation.box((char_x0, char_y0, char_x1, char_y1), (self.W, self.H))
+                    if char_box is None:
+                        continue
+                    char_x0, char_y0, char_x1, char_y1 = char_box
+                placements.append((char, x_pos, y_pos))
+                self._write_boxline(char, char_x0, char_y1, char_x1, char_y0, page_nb)  # add coordinates to boxfile
+                self.box_area += (box_x1 - box_x0) * (box_y1 - box_y0)
+            self.page_count += 1
+            self.glyph_count += len(placements)
+            self.unicharset.update(char for char, _, _ in placements)
+            yield placements
+        self.glyphs.save()
+
+    def fill_ratio(self):
+        """ Return the fraction of the area of the pages laid out so far covered by character boxes """
+        if not self.page_count:
+            return 0.0
+        return float(self.box_area) / (self.page_count * self.W * self.H)
+
+    def _render_pages(self, pages):
+        """ Render the laid out pages using self.jobs processes, and yield them in order
+            as single-page tifs compressed with CCITT Group 4 (see encode_page).
+            As pages are rendered independently, the result does not depend on the number of processes.
+        """
+        if self.jobs > 1:
+            pool = multiprocessing.Pool(self.jobs, _init_render_worker, (self,))
+            try:
+                # At most 2 pages per process are laid out ahead of the rendered ones,
+                # so that the text is only consumed as fast as pages are rendered.
+                # Pages are compressed by the rendering processes, and only written by this one.
+                rendering = collections.deque()
+                for page_nb, placements in enumerate(pages):
+                    rendering.append(pool.apply_async(_render_page_worker, (placements, page_nb)))
+                    if len(rendering) >= 2 * self.jobs:
+                        yield rendering.popleft().get()
+                while rendering:
+                    yield rendering.popleft().get()
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for page_nb, placements in enumerate(pages):
+                yield self._encode_page(placements, page_nb)
+
+    def _encode_page(self, placements, page_nb=0):
+        """ Render a laid out page, and return it Group 4 encoded (see encode_page) """
+        tif = self._render_page(placements, page_nb)
+        encoded_page = encode_page(tif)
+        self.buffers.release(tif)
+        return encoded_page
+
+    def _render_page(self, placements, page_nb=0):
+        """ Paste each placed character bitmap in a blank tif, degrade it if needed,
+            and return it as a black & white tif
         """
         tif = self._new_tif()
-        draw = ImageDraw.Draw(tif)
-        page_nb = 0
-        x_pos = self.start_x
-        y_pos = self.start_y
-        if self.verbose:
-            print('Generating individual tif image %s' % (self.indiv_page_prefix + str(page_nb) + '.tif'))
-        for word in self.text:
-            word += ' '  # add a space between each word
-            wordsize_w, wordsize_h = self.font.getsize(word)
-            #print("".join(["Word Size: ", str(wordsize_h)]))
-            # Check if word can fit the line, if not, newline
-            # if newline, check if the newline fits the page
-            # if not, save the current page and create a new one
-            if not word_fits_in_line(self.W, x_pos, wordsize_w):
-                if newline_fits_in_page(self.H, y_pos, wordsize_h):
-                    # newline
-                    x_pos = self.start_x
-                    y_pos += wordsize_h + 40
-                else:
-                    # newline AND newpage
-                    x_pos = self.start_x
-                    y_pos = self.start_y
-                    self._save_tif(tif, page_nb)  # save individual tif
-                    page_nb += 1
-                    if self.verbose:
-                        print('Generating individual tif image %s' % (self.indiv_page_prefix + str(page_nb) + '.tif'))
-                    tif = self._new_tif()  # new page
-                    draw = ImageDraw.Draw(tif)  # write on this new page
-            # write word
-            for char in word:
-                char_w, char_h = self.font.getsize(char)  # get character height / width
-                char_h = char_h + 1 #there seems to be a 1 pixel bias
-                offset= self.font.getoffset(char) #this accounts for the font baseline relation
-                #Custom offsets
-                offset_x0 = 0
-                offset_x1 = 0
-                offset_y0 = 0
-                offset_y1 = 0
-                try:
-                    offset_x0 = Offset_x0[char]
-                except:
-                    blah = 1 #do nothing
-                try:
-                    offset_y0 = Offset_y0[char]
-                except:
-                    blah = 1 #do nothing
-                try:
-                    offset_x1 = Offset_x1[char]
-                except:
-                    blah = 1 #do nothing
-                try:
-                    offset_y1 = Offset_y1[char]
-                except:
-                    blah = 1 #do nothing
-                    
-                char_x0, char_y0 = x_pos+offset[0]+offset_x0, y_pos+offset[1] + offset_y0 -1  # character top-left corner coordinates, adjusted for font baseline location, and custom offsets needed for bad sizing
-                char_x1, char_y1 = x_pos + char_w+offset[0] + offset_x1, y_pos + char_h + offset[1] + offset_y1 -1  # character bottom-roght corner coordinates
-                draw.text((x_pos, y_pos), char, fill="black", font=self.font)  # write character in tif file
-                if char != ' ':
-                    #draw.rectangle([(char_x0, char_y0),(char_x1, char_y1)], outline="red")
-                    theoffset = 0
-                    self._write_boxline(char, char_x0-theoffset, char_y1-theoffset, char_x1+theoffset, char_y0+theoffset, page_nb)  # add coordinates to boxfile
-                x_pos += char_w + 8.9 #+11.1
-        self._save_tif(tif, page_nb)  # save last tif
+        for char, x_pos, y_pos in placements:
+            self.atlas.draw(tif, char, x_pos, y_pos)  # write character in tif file
+        if self.bilevel:
+            return tif
+        if self.degradation is not None:
+            degraded = self.degradation.apply(tif, page_nb)
+            self.buffers.release(tif)
+            tif = degraded
+        page = tif.point(BILEVEL_TABLE, "1")
+        self.buffers.release(tif)
+        return page
 
     def _write_boxline(self, char, char_x0, char_y0, char_x1, char_y1, page_nb):
         """ Generate a boxfile line given a character coordinates, and append it to the
@@ -181,45 +299,193 @@ class MultiPageTif(object):
         boxline = '%s %d %d %d %d %d' % (char, tess_char_x0, tess_char_y0, tess_char_x1, tess_char_y1, page_nb)
         self.boxlines.append(boxline)
 
-    def _multipage_tif(self):
-        """ Generate a multipage tif from all the generated tifs.
-            The multipage tif will be named {self.prefix}.tif
+    def _multipage_tif(self, pages):
+        """ Render the laid out pages, and stream them into a multipage tif, as they are rendered.
+            The multipage tif will be named {self.directory}/{self.prefix}.tif
         """
-        #had to convert this to use os.system
-        #cmd = ['convert']  # ImageMagick command `convert` can merge individual tifs into a multipage tif file
-        cmd = 'convert -depth 1'
-        tifs = sorted(glob.glob(self.indiv_page_prefix + '*.tif'), key=os.path.getmtime)
-        for atif in tifs:
-            cmd = "".join([cmd," ",atif])
-        #cmd.extend(tifs)  # add all individual tifs as arguments
-        multitif_name = self.prefix + '.tif'
-        #multitif_name = 'multi.tif' #hack for now
-        #cmd.append(multitif_name)  # name of the result multipage tif
-        cmd = "".join([cmd," ",multitif_name])
+        multitif_name = self.path_prefix + '.tif'
         if self.verbose:
             print('Generating multipage-tif %s' % (multitif_name))
-        print(cmd)
-        #subprocess.call(cmd)  # merge of all individul tifs into a multipage one
-        os.system(cmd)
+        with MultiPageTifWriter(multitif_name) as tif_writer:
+            for page_nb, encoded_page in enumerate(self._render_pages(pages)):
+                if self.verbose:
+                    print('Rendered page %d' % (page_nb))
+                self._save_tif(encoded_page, tif_writer)
 
-    def _clean(self):
-        """ Remove all generated individual tifs """
-        if self.verbose:
-            print("Removing all individual tif images")
-        tifs = glob.glob('%s*' % (self.indiv_page_prefix))  # all individual tifd
-        for tif in tifs:
-            os.remove(tif)
 
+class PageBufferPool(object):
+    """ Page images of a given size, handed out blank and reused once released,
+        so that pages are not allocated (3600x3600 px: 13MB) one after the other.
+    """
 
-# Utility functions
-def word_fits_in_line(pagewidth, x_pos, wordsize_w):
-    """ Return True if a word can fit into a line. """
-    return (pagewidth - x_pos - wordsize_w) > 0
+    def __init__(self, size, capacity=1):
+
+        # (width, height) of the pages (in px)
+        self.size = size
+
+        # Maximum number of released pages of each mode kept for reuse
+        self.capacity = capacity
+
+        # Number of pages allocated so far
+        self.allocated = 0
+
+        # Image mode -> released pages
+        self._free = collections.defaultdict(list)
 
+        # Ids of the pages allocated by the pool, and not dropped since: only these are reused
+        self._owned = set()
 
-def newline_fits_in_page(pageheight, y_pos, wordsize_h):
-    """ Return True if a new line can be contained in a page. """
-    return (pageheight - y_pos - (2 * wordsize_h)) > 0
+    def acquire(self, mode, color="white"):
+        """ Return a page of the argument mode, filled with 'color' """
+        if self._free[mode]:
+            page = self._free[mode].pop()
+            page.paste(color, (0, 0) + self.size)
+            return page
+        page = Image.new(mode, self.size, color=color)
+        self._owned.add(id(page))
+        self.allocated += 1
+        return page
+
+    def release(self, page):
+        """ Give back a page returned by acquire, once it is not used anymore.
+            Other images are ignored.
+        """
+        if id(page) not in self._owned or page.size != self.size:
+            return
+        if len(self._free[page.mode]) < self.capacity:
+            self._free[page.mode].append(page)
+        else:
+            self._owned.discard(id(page))
+
+
+class MultiPageTifWriter(object):
+    """ Writer of a black & white multi-page tif, compressed with CCITT Group 4,
+        to which pages are appended one at a time.
+    """
+
+    def __init__(self, path, dpi=(300, 300)):
+
+        # Path of the written multi-page tif
+        self.path = path
+
+        # Resolution stored in each page
+        self.dpi = dpi
+
+        # Number of pages written so far
+        self.page_count = 0
+
+        self._tf = TiffImagePlugin.AppendingTiffWriter(path, new=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def append(self, tif):
+        """ Write the argument black & white tif as the last page of the multi-page tif """
+        self.append_encoded(encode_page(tif, self.dpi))
+
+    def append_encoded(self, encoded_page):
+        """ Write the argument single-page tif, as returned by encode_page, as the last page
+            of the multi-page tif: its compressed data is copied as is, and only its offsets are updated.
+        """
+        self._tf.write(encoded_page)
+        self._tf.newFrame()
+        self.page_count += 1
+
+    def close(self):
+        self._tf.close()
+
+
+def encode_page(tif, dpi=(300, 300)):
+    """ Return a black & white tif as the content of a single-page tif file, compressed with CCITT Group 4 """
+    encoded_page = io.BytesIO()
+    tif.save(encoded_page, format="TIFF", compression="group4", dpi=dpi)
+    return encoded_page.getvalue()
+
+
+# Fonts opened by the current process
+_fonts = {}  # (font path, font size, bilevel) -> (font, glyph metrics, glyph atlas)
+
+
+def load_font(font_path, fontsize, bilevel=False, glyph_cache=None):
+    """ Return the (font, glyph metrics, glyph atlas) of a font at a given size, opening the font
+        and creating its glyph caches only the first time they are requested by the current process
+    """
+    key = (font_path, fontsize, bilevel)
+    if key not in _fonts:
+        font = ImageFont.truetype(font_path, fontsize)
+        glyphs = GlyphCache(font, font_path, fontsize, (Offset_x0, Offset_y0, Offset_x1, Offset_y1),
+            cache_path=glyph_cache)
+        _fonts[key] = (font, glyphs, GlyphAtlas(font, bilevel))
+    return _fonts[key]
+
+
+# Rendering processes
+_worker_tif = None  # MultiPageTif whose pages are rendered by the current process
+
+
+def _init_render_worker(multipage_tif):
+    """ Initialize a rendering process with the page settings of a MultiPageTif """
+    global _worker_tif
+    _worker_tif = multipage_tif
+
+
+def _render_page_worker(placements, page_nb):
+    """ Render a laid out page in a rendering process, and return it Group 4 encoded (see encode_page) """
+    return _worker_tif._encode_page(placements, page_nb)
+
+
+# Utility functions
+def split_multipage_tif(prefix, shards):
+    """ Split the {prefix}.tif multipage tif and its {prefix}.box boxfile into (at most) 'shards'
+        multipage tifs and boxfiles of consecutive pages, named {prefix}.shard{n}.tif/box,
+        with page numbers starting from 0 in each shard.
+        Return the list of shard prefixes, in page order.
+    """
+    tif = Image.open(prefix + '.tif')
+    page_count = tif.n_frames
+    shards = max(1, min(shards, page_count))
+    # the first page of each shard, and the page following the last one
+    bounds = [shard * page_count // shards for shard in range(shards + 1)]
+    shard_prefixes = ['%s.shard%d' % (prefix, shard) for shard in range(shards)]
+
+    for shard_prefix, first_page, end_page in zip(shard_prefixes, bounds, bounds[1:]):
+        with MultiPageTifWriter(shard_prefix + '.tif', dpi=tif.info.get('dpi', (300, 300))) as tif_writer:
+            for page_nb in range(first_page, end_page):
+                tif.seek(page_nb)
+                tif_writer.append(tif)
+
+    boxfiles = [open(shard_prefix + '.box', 'w') for shard_prefix in shard_prefixes]
+    try:
+        shard = 0
+        with open(prefix + '.box', 'r') as boxfile:
+            for boxline in boxfile:
+                char_box, page_nb = boxline.rsplit(' ', 1)
+                page_nb = int(page_nb)
+                while page_nb >= bounds[shard + 1]:
+                    shard += 1
+                boxfiles[shard].write('%s %d\n' % (char_box, page_nb - bounds[shard]))
+    finally:
+        for boxfile in boxfiles:
+            boxfile.close()
+    return shard_prefixes
+
+
+def iter_words(text_path, chunk_size=1 << 16):
+    """ Lazily read a training text file, and yield its (utf-8 encoded) words.
+        The words are the same as when splitting the whole text over " "s,
+        once all newlines have been replaced by " "s.
+    """
+    remainder = ''
+    with open(text_path, 'rb') as text_file:
+        for chunk in iter(lambda: text_file.read(chunk_size), ''):
+            words = (remainder + chunk.replace('\n', ' ')).split(' ')
+            remainder = words.pop()  # possibly incomplete last word
+            for word in words:
+                yield word
+    yield remainder
 
 
 def pil_coord_to_tesseract(pil_x, pil_y, tif_h):
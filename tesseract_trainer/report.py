@@ -0,0 +1,234 @@
+"""
+Instrumentation of the training process: wall time, CPU time and memory usage
+of each training stage, of each external command and of the tif generation phases,
+gathered in a machine-readable JSON report.
+"""
+
+import cProfile
+import json
+import os
+import resource
+import threading
+import time
+
+from contextlib import contextmanager
+from os.path import exists, join
+
+
+class RunReport(object):
+    """ Timings and resource usage of a training run """
+
+    def __init__(self, profile_dir=None):
+
+        # Directory the cProfile statistics of the tif rendering are written to. If None, nothing is profiled.
+        self.profile_dir = profile_dir
+
+        # One dict per training stage, run or skipped
+        self.stages = []
+
+        # One dict per tif generation phase (text layout, tif rendering)
+        self.phases = []
+
+        # External commands run outside of any stage
+        self.commands = []
+
+        self._start_time = time.time()
+        self._local = threading.local()
+
+        # Processes of the external commands running, terminated if the training fails
+        self._processes = set()
+        self._processes_lock = threading.Lock()
+        self._terminated = False
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # the current stage of each thread, and the running commands, only make sense in this process
+        for name in ('_local', '_processes', '_processes_lock', '_terminated'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+        self._processes = set()
+        self._processes_lock = threading.Lock()
+        self._terminated = False
+
+    def current_stage(self):
+        """ Return the record of the stage running in the current thread, or None """
+        return getattr(self._local, 'stage', None)
+
+    def bind(self, func):
+        """ Wrap 'func' so that the commands it runs, even in another thread,
+            are recorded in the stage running in the current thread.
+        """
+        stage = self.current_stage()
+
+        def bound(*args, **kwargs):
+            self._local.stage = stage
+            return func(*args, **kwargs)
+        return bound
+
+    @contextmanager
+    def stage(self, name, outputs=()):
+        """ Record the time spent and the resources used while running a stage,
+            along with the size of its 'outputs' files.
+            The children CPU time and peak memory usage are the ones of the commands of the stage. The process_*
+            figures are the ones of the whole process, including the stages running at the same time.
+        """
+        record = {'name': name, 'skipped': False, 'commands': []}
+        self.stages.append(record)
+        self._local.stage = record
+        start = _usage()
+        try:
+            yield record
+        finally:
+            self._local.stage = None
+            record.update(_usage_since(start))
+            record['children_cpu_time'] = sum(command['cpu_time'] for command in record['commands'])
+            record['children_max_rss_kb'] = max([command['max_rss_kb'] for command in record['commands']] or [0])
+            record['bytes_written'] = sum(os.path.getsize(path) for path in outputs if exists(path))
+
+    def skipped(self, name):
+        """ Record a stage skipped as its outputs were current """
+        self.stages.append({'name': name, 'skipped': True})
+
+    def command_started(self, process):
+        """ Register the subprocess.Popen of an external command, until it is passed to command_exited.
+            If the commands were terminated (see terminate_commands), it is terminated right away.
+        """
+        with self._processes_lock:
+            self._processes.add(process)
+            if self._terminated:
+                _terminate(process)
+
+    def command_exited(self, process):
+        """ Unregister the process of an external command, once it exited """
+        with self._processes_lock:
+            self._processes.discard(process)
+
+    def terminate_commands(self):
+        """ Terminate the external commands running, and the ones started afterwards """
+        with self._processes_lock:
+            self._terminated = True
+            for process in self._processes:
+                _terminate(process)
+
+    def command(self, cmd, wall_time, rusage, returncode):
+        """ Record an external command, with its resource usage as returned by os.wait4 """
+        record = {
+            'command': cmd,
+            'returncode': returncode,
+            'wall_time': wall_time,
+            'cpu_time': rusage.ru_utime + rusage.ru_stime,
+            'max_rss_kb': rusage.ru_maxrss,
+        }
+        stage = self.current_stage()
+        (stage['commands'] if stage is not None else self.commands).append(record)
+
+    def phase(self, name, stopwatch, **counters):
+        """ Record the time spent in a phase of the tif generation, measured by 'stopwatch',
+            along with counters (pages, glyphs...).
+        """
+        record = dict(counters, name=name, wall_time=stopwatch.wall_time, cpu_time=stopwatch.cpu_time,
+            max_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+        self.phases.append(record)
+
+    @contextmanager
+    def profiling(self, name):
+        """ Profile the code run in the context, and dump the statistics to {self.profile_dir}/{name}.prof """
+        if self.profile_dir is None:
+            yield
+            return
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            if not exists(self.profile_dir):
+                os.makedirs(self.profile_dir)
+            profile.dump_stats(join(self.profile_dir, '%s.prof' % (name)))
+
+    def as_dict(self):
+        self_usage = resource.getrusage(resource.RUSAGE_SELF)
+        children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return {
+            'wall_time': time.time() - self._start_time,
+            'cpu_time': self_usage.ru_utime + self_usage.ru_stime,
+            'children_cpu_time': children_usage.ru_utime + children_usage.ru_stime,
+            'max_rss_kb': self_usage.ru_maxrss,
+            'children_max_rss_kb': children_usage.ru_maxrss,
+            'stages': self.stages,
+            'phases': self.phases,
+            'commands': self.commands,
+        }
+
+    def write(self, path):
+        """ Write the report to 'path', as JSON """
+        with open(path, 'w') as report_file:
+            json.dump(self.as_dict(), report_file, indent=2, sort_keys=True)
+
+
+class Stopwatch(object):
+    """ Wall time and CPU time of the process spent in a phase, accumulated over several intervals """
+
+    def __init__(self):
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+
+    @contextmanager
+    def running(self):
+        """ Measure the time spent in the context """
+        start_time, start_cpu_time = time.time(), _cpu_time()
+        try:
+            yield
+        finally:
+            self.wall_time += time.time() - start_time
+            self.cpu_time += _cpu_time() - start_cpu_time
+
+    def iterate(self, iterable):
+        """ Iterate over 'iterable', only measuring the time spent producing its items """
+        iterator = iter(iterable)
+        while True:
+            with self.running():
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+
+def _terminate(process):
+    """ Send SIGTERM to a process, unless it already exited """
+    try:
+        process.terminate()
+    except OSError:
+        pass
+
+
+def _cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _usage():
+    """ Return the current wall time and resource usage of the process and its terminated children """
+    return time.time(), resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+
+
+def _usage_since(start):
+    """ Return the wall time since 'start' (see _usage), along with the CPU time and peak memory usage
+        of the process and of its terminated children
+    """
+    start_time, start_self, start_children = start
+    end_time, end_self, end_children = _usage()
+    usage = {
+        'wall_time': end_time - start_time,
+        'process_cpu_time': (end_self.ru_utime + end_self.ru_stime) - (start_self.ru_utime + start_self.ru_stime),
+        'process_max_rss_kb': end_self.ru_maxrss,
+        'process_children_cpu_time': ((end_children.ru_utime + end_children.ru_stime)
+            - (start_children.ru_utime + start_children.ru_stime)),
+        'process_children_max_rss_kb': end_children.ru_maxrss,
+    }
+    return usage
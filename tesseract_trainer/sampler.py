@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+"""
+Selection of the training text words worth rendering.
+
+Large training texts are mostly made of common characters: a text large enough for
+its rare characters to get enough samples repeats the common ones thousands of times.
+The sampler streams the text, and only keeps the words providing samples of a character
+(and optionally of a pair of consecutive characters) which does not have enough yet.
+"""
+
+import json
+
+from collections import Counter
+
+
+class CoverageSampler(object):
+    """ Streaming selection of words giving each character at least 'min_samples' samples """
+
+    def __init__(self, min_samples, bigrams=False, max_glyphs=None):
+
+        # Number of samples wanted for each character (and bigram)
+        self.min_samples = min_samples
+
+        # Set bigrams to True to also want 'min_samples' samples of each pair of consecutive characters
+        self.bigrams = bigrams
+
+        # Maximum number of characters (white spaces excluded) of the selected words. If None, there is no limit.
+        self.max_glyphs = max_glyphs
+
+        # Number of samples of each character/bigram in the selected words
+        self.selected = Counter()
+
+        # Number of samples of each character/bigram in the words read so far
+        self.available = Counter()
+
+        # Number of words read and selected, and number of characters of the selected words
+        self.words_read = 0
+        self.words_selected = 0
+        self.glyph_count = 0
+
+        # Set to True once a word lacking samples could not be selected without exceeding self.max_glyphs:
+        # no word is selected afterwards, but the rest of the text is still read, so that the characters
+        # it holds are reported as undercovered
+        self.truncated = False
+
+    def _units(self, word):
+        """ Return the characters, and if self.bigrams is True the bigrams, of a (unicode) word """
+        units = list(word)
+        if self.bigrams:
+            units.extend(word[i:i + 2] for i in range(len(word) - 1))
+        return units
+
+    def sample(self, words):
+        """ Yield the (utf-8 encoded) words providing samples of a character or bigram lacking some,
+            in text order, until the selected words would exceed self.max_glyphs characters.
+        """
+        for word in words:
+            chars = word.decode('utf-8')
+            if not chars:
+                continue
+            self.words_read += 1
+            units = self._units(chars)
+            self.available.update(units)
+            if self.truncated or all(self.selected[unit] >= self.min_samples for unit in units):
+                continue
+            if self.max_glyphs is not None and self.glyph_count + len(chars) > self.max_glyphs:
+                self.truncated = True
+                continue
+            self.selected.update(units)
+            self.words_selected += 1
+            self.glyph_count += len(chars)
+            yield word
+
+    def undercovered(self):
+        """ Return the characters and bigrams which got less than self.min_samples samples, sorted """
+        return sorted(unit for unit in self.available if self.selected[unit] < self.min_samples)
+
+    def coverage(self):
+        """ Return the coverage achieved: for each character and bigram, the number of samples
+            selected and available, along with the word and character counts.
+        """
+        units = dict((unit, [self.selected[unit], self.available[unit]]) for unit in self.available)
+        return {
+            'min_samples': self.min_samples,
+            'max_glyphs': self.max_glyphs,
+            'words_read': self.words_read,
+            'words_selected': self.words_selected,
+            'glyphs': self.glyph_count,
+            'truncated': self.truncated,
+            'characters': dict((unit, counts) for unit, counts in units.items() if len(unit) == 1),
+            'bigrams': dict((unit, counts) for unit, counts in units.items() if len(unit) == 2),
+            'undercovered': self.undercovered(),
+        }
+
+    def write_coverage(self, path):
+        """ Write the coverage achieved to 'path', as JSON """
+        with open(path, 'w') as coverage_file:
+            json.dump(self.coverage(), coverage_file, indent=1, sort_keys=True)
@@ -0,0 +1,211 @@
+"""
+Incremental training support.
+
+Each training stage declares the files it reads and writes, and the other
+parameters its outputs depend on. A manifest records, for each stage, a digest
+of its inputs and the digests of its outputs, so that a stage whose outputs
+are still current can be skipped when the training is resumed.
+
+The stages are run as a dependency graph: a stage depends on the stages producing
+its inputs, and stages which do not depend on each other run concurrently.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from distutils.spawn import find_executable
+from os.path import exists
+
+from glyph_cache import file_digest
+
+
+TERMINATION_GRACE = 5.0  # Seconds given to the stages still running to stop, once a stage failed
+
+
+class Stage(object):
+    """ A step of the training process, declaring its inputs and outputs """
+
+    def __init__(self, name, run, inputs=(), outputs=(), params=()):
+
+        # Name of the stage, used in the manifest and to force the stage to run
+        self.name = name
+
+        # Callable executing the stage
+        self.run = run
+
+        # Paths of the files read by the stage
+        self.inputs = list(inputs)
+
+        # Paths of the files written by the stage
+        self.outputs = list(outputs)
+
+        # JSON serializable values the outputs depend on, besides the inputs content
+        self.params = list(params)
+
+
+class StageManifest(object):
+    """ Record of the input and output digests of the stages run so far, persisted as JSON """
+
+    def __init__(self, path):
+
+        # Path of the JSON manifest file
+        self.path = path
+
+        # Stage name -> {'inputs': digest of the inputs, 'outputs': {output path: digest}}
+        self.stages = {}
+        if exists(self.path):
+            with open(self.path, 'r') as manifest:
+                self.stages = json.load(manifest)
+
+        # Digests of the files hashed so far, keyed by (path, size, modification time)
+        self._digests = {}
+
+    def file_digest(self, path):
+        """ Return the digest of a file content, or None if it does not exist """
+        if not exists(path):
+            return None
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime)
+        if key not in self._digests:
+            self._digests[key] = file_digest(path)
+        return self._digests[key]
+
+    def input_digest(self, stage):
+        """ Return a digest of the parameters and input files content of a stage """
+        digest = hashlib.sha1()
+        digest.update(json.dumps(stage.params, sort_keys=True).encode('utf-8'))
+        for path in stage.inputs:
+            digest.update(('%s %s\n' % (path, self.file_digest(path))).encode('utf-8'))
+        return digest.hexdigest()
+
+    def is_current(self, stage):
+        """ Return True if a stage ran with the same inputs, and its outputs were not modified since """
+        record = self.stages.get(stage.name)
+        if record is None or record['inputs'] != self.input_digest(stage):
+            return False
+        return all(self.file_digest(path) is not None and self.file_digest(path) == record['outputs'].get(path)
+            for path in stage.outputs)
+
+    def record(self, stage):
+        """ Record the current inputs and outputs of a stage that just ran, and save the manifest """
+        self.stages[stage.name] = {
+            'inputs': self.input_digest(stage),
+            'outputs': dict((path, self.file_digest(path)) for path in stage.outputs),
+        }
+        self.save()
+
+    def forget(self):
+        """ Remove the manifest file """
+        if exists(self.path):
+            os.remove(self.path)
+        self.stages = {}
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as manifest:
+            json.dump(self.stages, manifest, indent=1, sort_keys=True)
+        os.rename(tmp_path, self.path)  # a crash never leaves a half-written manifest behind
+
+
+def run_stages(stages, manifest, report, resume=False, force_stages=(), verbose=True):
+    """ Run all stages, each one as soon as the stages producing its inputs are done, recording
+        them in the manifest and their resource usage in the report.
+        If 'resume' is True, the stages whose outputs are current are skipped, except for
+        the ones named in 'force_stages'.
+        If a stage fails, no other stage is started, the commands of the stages still running
+        are terminated, and the error is raised once these stages stopped, or after TERMINATION_GRACE seconds.
+    """
+    unknown_stages = set(force_stages) - set(stage.name for stage in stages)
+    if unknown_stages:
+        raise SystemExit("Unknown training stage(s): %s. Valid stages are: %s. Aborting." % (
+            ', '.join(sorted(unknown_stages)), ', '.join(stage.name for stage in stages)))
+
+    producers = dict((path, stage.name) for stage in stages for path in stage.outputs)
+    dependencies = dict((stage.name, set(producers[path] for path in stage.inputs
+        if path in producers and producers[path] != stage.name)) for stage in stages)
+
+    pending = list(stages)
+    running = set()
+    done = set()
+    finished = queue.Queue()
+    while pending or running:
+        ready = [stage for stage in pending if dependencies[stage.name] <= done]
+        for stage in ready:
+            pending.remove(stage)
+            if resume and stage.name not in force_stages and manifest.is_current(stage):
+                if verbose:
+                    print('Skipping the %s stage: its outputs are current.' % (stage.name))
+                report.skipped(stage.name)
+                done.add(stage.name)
+            elif len(ready) == 1 and not running:
+                # nothing to run concurrently: run the stage in this thread
+                _run_stage(stage, report)
+                manifest.record(stage)
+                done.add(stage.name)
+            else:
+                running.add(stage.name)
+                thread = threading.Thread(target=_run_stage, args=(stage, report, finished))
+                thread.daemon = True
+                thread.start()
+        if ready:
+            continue  # skipped or finished stages may have made other stages ready
+        if not running:
+            break
+        # a timeout keeps the wait interruptible by Ctrl-C: once it expires, the stages are waited for again
+        try:
+            stage, stage_error = finished.get(True, 24 * 3600)
+        except queue.Empty:
+            continue
+        running.remove(stage.name)
+        if stage_error is not None:
+            # the stages still running fail as soon as their commands are terminated
+            report.terminate_commands()
+            deadline = time.time() + TERMINATION_GRACE
+            while running and time.time() < deadline:
+                try:
+                    stopped_stage, _ = finished.get(True, deadline - time.time())
+                except queue.Empty:
+                    break
+                running.remove(stopped_stage.name)
+            raise stage_error
+        manifest.record(stage)
+        done.add(stage.name)
+    if pending:
+        raise SystemExit("The %s stage(s) depend on each other. Aborting." % (
+            ', '.join(stage.name for stage in pending)))
+
+
+def _run_stage(stage, report, finished=None):
+    """ Run a stage, recording its resource usage in the report.
+        If 'finished' is given, the stage and its error (or None) are put in this queue
+        instead of the error being raised.
+    """
+    try:
+        with report.stage(stage.name, stage.outputs):
+            stage.run()
+    except BaseException as error:
+        if finished is None:
+            raise
+        finished.put((stage, error))
+    else:
+        if finished is not None:
+            finished.put((stage, None))
+
+
+def tool_fingerprint(tool):
+    """ Return a value identifying the installed version of an external tool:
+        its path, size and modification time.
+    """
+    path = find_executable(tool)
+    if path is None:
+        return [tool, None]
+    stat = os.stat(path)
+    return [path, stat.st_size, int(stat.st_mtime)]
@@ -0,0 +1,208 @@
+"""
+Packing, inspection and installation of tesseract 'traineddata' files, without combine_tessdata.
+
+A traineddata file is made of a header, listing the offset of each component in the file
+(-1 for the components it does not contain), followed by the content of each component file:
+
+    int32 number of components
+    int64 offset of each component
+    component files content
+
+The files are read through mmap, so that inspecting or extracting a component only reads
+the header and the component itself, however large the traineddata is.
+"""
+
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+
+from os.path import exists, join
+
+
+# Components of a traineddata file, in order, named after the suffix of the component files (tesseract 3.02)
+COMPONENTS = [
+    'config',
+    'unicharset',
+    'unicharambigs',
+    'inttemp',
+    'pffmtable',
+    'normproto',
+    'punc-dawg',
+    'word-dawg',
+    'number-dawg',
+    'freq-dawg',
+    'fixed-length-dawgs',
+    'cube-unicharset',
+    'cube-word-dawg',
+    'shapetable',
+    'bigram-dawg',
+    'unambig-dawg',
+]
+
+
+class TrainedData(object):
+    """ Read-only access to the components of a traineddata file """
+
+    def __init__(self, path):
+
+        # Path of the traineddata file
+        self.path = path
+
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ) if size else b''
+
+        # Byte order of the header: the files are written in the byte order of the machine packing them
+        self.byte_order = '<'
+        entry_count = self._unpack('i', 0)
+        if not 0 < entry_count <= len(COMPONENTS):
+            self.byte_order = '>'
+            entry_count = self._unpack('i', 0)
+        if not 0 < entry_count <= len(COMPONENTS):
+            self.close()
+            raise SystemExit("%s is not a traineddata file. Aborting." % (path))
+
+        # Component name -> (offset, size) of the components found in the file, in file order
+        offsets = [(self._unpack('q', 4 + 8 * entry), COMPONENTS[entry]) for entry in range(entry_count)]
+        offsets = sorted((offset, name) for offset, name in offsets if offset >= 0)
+        ends = [offset for offset, _ in offsets[1:]] + [size]
+        self.toc = dict((name, (offset, end - offset)) for (offset, name), end in zip(offsets, ends))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __contains__(self, name):
+        return name in self.toc
+
+    def _unpack(self, fmt, offset):
+        fmt = self.byte_order + fmt
+        if offset + struct.calcsize(fmt) > len(self._map):
+            raise SystemExit("%s is truncated. Aborting." % (self.path))
+        return struct.unpack(fmt, self._map[offset:offset + struct.calcsize(fmt)])[0]
+
+    def components(self):
+        """ Return the (name, size) of the components of the file, in the tesseract components order """
+        return [(name, self.toc[name][1]) for name in COMPONENTS if name in self.toc]
+
+    def read(self, name):
+        """ Return the content of a component """
+        offset, size = self.toc[name]
+        return self._map[offset:offset + size]
+
+    def extract(self, name, path, chunk_size=1 << 20):
+        """ Write the content of a component to 'path' """
+        offset, size = self.toc[name]
+        with open(path, 'wb') as component_file:
+            for start in range(offset, offset + size, chunk_size):
+                component_file.write(self._map[start:min(start + chunk_size, offset + size)])
+
+    def close(self):
+        if not isinstance(self._map, bytes):
+            self._map.close()
+        self._file.close()
+
+
+def pack_traineddata(prefix, traineddata_path):
+    """ Pack the component files named {prefix}{component} (ex: eng.unicharset) found on disk
+        into 'traineddata_path', as combine_tessdata does. Return the names of the packed components.
+        The traineddata file is only replaced once completely written.
+    """
+    component_paths = [(name, prefix + name) for name in COMPONENTS if exists(prefix + name)]
+    if not component_paths:
+        raise SystemExit("No traineddata component file named %s* was found. Aborting." % (prefix))
+    sizes = dict((name, os.path.getsize(path)) for name, path in component_paths)
+
+    offsets = []
+    offset = 4 + 8 * len(COMPONENTS)
+    for name in COMPONENTS:
+        if name in sizes:
+            offsets.append(offset)
+            offset += sizes[name]
+        else:
+            offsets.append(-1)
+
+    tmp_path = '%s.%d.tmp' % (traineddata_path, os.getpid())
+    with open(tmp_path, 'wb') as traineddata:
+        traineddata.write(struct.pack('<i%dq' % (len(COMPONENTS)), len(COMPONENTS), *offsets))
+        for name, path in component_paths:
+            with open(path, 'rb') as component_file:
+                shutil.copyfileobj(component_file, traineddata)
+    os.rename(tmp_path, traineddata_path)
+    return [name for name, _ in component_paths]
+
+
+def diff_traineddata(path_a, path_b):
+    """ Compare two traineddata files, component by component.
+        Return a dict mapping the name of each component which differs to 'added', 'removed' or 'changed'.
+        The content of components of the same size is only read to compare them.
+    """
+    diff = {}
+    with TrainedData(path_a) as a:
+        with TrainedData(path_b) as b:
+            for name in COMPONENTS:
+                if name not in a and name in b:
+                    diff[name] = 'added'
+                elif name in a and name not in b:
+                    diff[name] = 'removed'
+                elif name in a and (a.toc[name][1] != b.toc[name][1] or a.read(name) != b.read(name)):
+                    diff[name] = 'changed'
+    return diff
+
+
+def install_traineddata(traineddata_path, tessdata_path):
+    """ Copy a traineddata file to the tessdata directory, so that the tesseract processes reading
+        the directory never see a partially copied file: the file is copied next to its destination,
+        and renamed over it once complete.
+        Return the path of the installed file.
+    """
+    destination = join(tessdata_path, os.path.basename(traineddata_path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.%s.' % (os.path.basename(traineddata_path)), dir=tessdata_path)
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            with open(traineddata_path, 'rb') as traineddata:
+                shutil.copyfileobj(traineddata, tmp_file)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.chmod(tmp_path, 0o644)  # mkstemp files are only readable by their owner
+        os.rename(tmp_path, destination)
+    except BaseException:
+        if exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return destination
+
+
+def main():
+    """ Command line inspection of traineddata files """
+    import argparse
+    parser = argparse.ArgumentParser(description='Inspect tesseract traineddata files.')
+    parser.add_argument('traineddata', type=str, help="The path of a traineddata file.")
+    parser.add_argument('--extract', type=str, action='append', default=[], metavar='COMPONENT',
+        help="The name of a component to extract to {traineddata prefix}.{component}. Can be repeated.")
+    parser.add_argument('--diff', type=str, action='store', metavar='TRAINEDDATA',
+        help="The path of another traineddata file to compare the components with.")
+    args = parser.parse_args()
+
+    if args.diff:
+        for name, status in sorted(diff_traineddata(args.traineddata, args.diff).items(),
+                key=lambda item: COMPONENTS.index(item[0])):
+            print('%-20s %s' % (name, status))
+        return
+    with TrainedData(args.traineddata) as traineddata:
+        prefix = os.path.splitext(args.traineddata)[0]
+        for name in args.extract:
+            if name not in traineddata:
+                raise SystemExit("%s has no %s component. Aborting." % (args.traineddata, name))
+            traineddata.extract(name, '%s.%s' % (prefix, name))
+        if not args.extract:
+            for name, size in traineddata.components():
+                print('%-20s %10d' % (name, size))
+
+
+if __name__ == '__main__':
+    main()
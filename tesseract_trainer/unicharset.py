@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+"""
+Generation of the tesseract 'unicharset' file: the list of the characters the training
+is made on, along with their properties (isalpha, islower, isupper, isdigit, ispunctuation),
+their script and their other case.
+
+The character set is collected while the training text is laid out, rather than by
+running unicharset_extractor, which would have to parse back the boxfiles.
+"""
+
+import unicodedata
+
+from collections import OrderedDict
+
+
+# Property bits of a character, as written in the unicharset file
+ALPHA = 1
+LOWER = 2
+UPPER = 4
+DIGIT = 8
+PUNCTUATION = 16
+
+# Script of the alphabetic characters whose unicode name does not start with the script name
+SCRIPTS = {'CJK': 'Han'}
+
+
+class Unicharset(object):
+    """ Characters of the training boxfiles, in order of first appearance """
+
+    def __init__(self, chars=()):
+
+        # Characters (unicode), as the keys of an ordered dict so that they keep the order
+        # they were found in, as with unicharset_extractor
+        self.chars = OrderedDict()
+        self.update(chars)
+
+    def __len__(self):
+        return len(self.chars)
+
+    def __iter__(self):
+        return iter(self.chars)
+
+    def update(self, chars):
+        """ Add the argument (unicode) characters, if not already present """
+        for char in chars:
+            if char not in self.chars:
+                self.chars[char] = None
+
+    @classmethod
+    def from_boxfile(cls, boxfile_path):
+        """ Return the character set of a boxfile, each line of which is "char x0 y0 x1 y1 page_number" """
+        unicharset = cls()
+        with open(boxfile_path, 'r') as boxfile:
+            unicharset.update(line.rsplit(' ', 5)[0].decode('utf-8') for line in boxfile if line.strip())
+        return unicharset
+
+    def write(self, path):
+        """ Write the character set to 'path', in the tesseract 3.01 unicharset format:
+            the number of characters, then one "char properties script other_case" line per character,
+            the first one being the NULL character, and other_case being the line number (from 0)
+            of the other case of the character.
+        """
+        ids = dict((char, unichar_id) for unichar_id, char in enumerate(self.chars, 1))
+        with open(path, 'w') as unicharset_file:
+            unicharset_file.write('%d\n' % (len(self.chars) + 1))
+            unicharset_file.write('NULL 0 Common 0\n')
+            for unichar_id, char in enumerate(self.chars, 1):
+                other_case = ids.get(char.swapcase(), unichar_id)
+                unicharset_file.write('%s %x %s %d\n' % (char.encode('utf-8'), char_properties(char), char_script(char),
+                    other_case))
+
+
+def char_properties(char):
+    """ Return the property bits of a (unicode) character
+
+        examples:
+        ';' is an punctuation character: 10000 (10 in hexadecimal).
+        'b' is an alphabetic character and a lower case character: 00011 (3 in hexadecimal).
+        'W' is an alphabetic character and an upper case character: 00101 (5 in hexadecimal).
+        '7' is just a digit: 01000 (8 in hexadecimal).
+        '=' is not punctuation nor digit or alphabetic character: 00000 (0 in hexadecimal).
+    """
+    properties = 0
+    if char.isalpha():
+        properties |= ALPHA
+    if char.islower():
+        properties |= LOWER
+    if char.isupper():
+        properties |= UPPER
+    if char.isdigit():
+        properties |= DIGIT
+    if unicodedata.category(char).startswith('P'):
+        properties |= PUNCTUATION
+    return properties
+
+
+def char_script(char):
+    """ Return the script of a (unicode) character: the first word of the unicode name of the alphabetic
+        characters (ex: 'Latin', 'Greek', 'Cyrillic'), and 'Common' for the others.
+    """
+    if not char.isalpha():
+        return 'Common'
+    script = unicodedata.name(char, 'COMMON').split()[0]
+    return SCRIPTS.get(script, script.capitalize())
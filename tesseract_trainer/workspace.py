@@ -0,0 +1,61 @@
+"""
+Per-training working directories.
+
+All the intermediate files of a training (tifs, boxfiles, training files, clusters...) are
+written to the workspace of the training, and the tesseract training tools are run from it,
+so that several trainings can run at the same time on the same machine, or in the same process.
+Only the resulting traineddata file is promoted out of the workspace.
+"""
+
+import os
+import shutil
+import tempfile
+
+from os.path import exists, join
+
+from traineddata import install_traineddata
+
+
+TMPFS_PATH = '/dev/shm'  # Where the workspaces are created when they are requested on tmpfs
+
+
+class Workspace(object):
+    """ Directory holding the intermediate files of a training """
+
+    def __init__(self, path=None, tmpfs=False, name='tesstrain'):
+
+        # Set to True when the directory is created by the workspace: only then is it removed along with the workspace
+        self.created = path is None or not exists(path)
+
+        if path is None:
+            parent = TMPFS_PATH if tmpfs else os.getcwd()
+            if not os.path.isdir(parent):
+                raise SystemExit("The %s directory does not exist. Aborting." % (parent))
+            path = tempfile.mkdtemp(prefix='%s.' % (name), suffix='.workspace', dir=parent)
+        elif not exists(path):
+            os.makedirs(path)
+
+        # Absolute path of the directory
+        self.path = os.path.abspath(path)
+
+    def join(self, *names):
+        """ Return the absolute path of a file of the workspace """
+        return join(self.path, *names)
+
+    def promote(self, name, destination='.'):
+        """ Atomically copy the {name} file of the workspace to the 'destination' directory,
+            and return the path of the copy
+        """
+        return install_traineddata(self.join(name), destination)
+
+    def remove(self, paths=()):
+        """ Remove the workspace and all the files it contains, if its directory was created by the workspace.
+            Otherwise, the directory and the files it already held are kept: only the argument files
+            (the ones written by the training) are removed.
+        """
+        if self.created:
+            shutil.rmtree(self.path, ignore_errors=True)
+            return
+        for path in paths:
+            if exists(path):
+                os.remove(path)